@@ -0,0 +1,85 @@
+"""
+Microbenchmark for the loan listing serialization path.
+
+Compares, at 10k and 100k loans, the previous path (ORM objects, ``to_dict``
+per object, stdlib JSON) with the column-tuple path the list endpoints use
+now (compiled row serializer), encoded with the standard library and with
+orjson.
+
+    python bench_serialization.py [--sizes 10000,100000] [--repeat 3]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_tmp = tempfile.TemporaryDirectory(prefix="library-serialization-")
+os.environ["BOOKS_DATABASE_URI"] = f"sqlite:///{os.path.join(_tmp.name, 'books.db')}"
+
+import serialization  # noqa: E402
+from books_service import LOAN_COLUMNS, Loan, app, db, migrate_schema  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from serialization import JSONProvider, as_rows  # noqa: E402
+
+
+def seed(count: int) -> None:
+    db.session.execute(db.delete(Loan))
+    now = datetime.utcnow()
+    db.session.execute(db.insert(Loan), [
+        {"user_id": i % 997, "book_id": i, "borrowed_at": now - timedelta(days=i % 30),
+         "due_date": now + timedelta(days=14 - i % 30), "returned_at": now if i % 3 == 0 else None}
+        for i in range(1, count + 1)
+    ])
+    db.session.commit()
+
+
+def orm_to_dict_stdlib() -> int:
+    rows = Loan.query.order_by(Loan.id).all()
+    data = [{"id": l.id, "user_id": l.user_id, "book_id": l.book_id, "borrowed_at": l.borrowed_at,
+             "returned_at": l.returned_at, "due_date": l.due_date} for l in rows]
+    body = DefaultJSONProvider(app).dumps(data)
+    db.session.expunge_all()
+    return len(body)
+
+
+def tuples(provider) -> int:
+    query, serialize = as_rows(Loan.query.order_by(Loan.id), LOAN_COLUMNS)
+    return len(provider.dumps([serialize(row) for row in query.all()]))
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    provider = JSONProvider(app)
+    orjson = serialization.orjson
+    with app.app_context():
+        migrate_schema()
+        print(f"{'rows':>8}  {'ORM + to_dict + stdlib':>24}  {'tuples + stdlib':>17}  {'tuples + orjson':>17}")
+        for size in (int(s) for s in args.sizes.split(",")):
+            seed(size)
+            baseline = best_of(orm_to_dict_stdlib, args.repeat)
+            serialization.orjson = None
+            plain = best_of(lambda: tuples(provider), args.repeat)
+            serialization.orjson = orjson
+            fast = best_of(lambda: tuples(provider), args.repeat) if orjson else None
+            cells = [f"{baseline * 1000:>21.0f} ms", f"{plain * 1000:>8.0f} ms ({baseline / plain:.1f}x)"]
+            cells.append(f"{fast * 1000:>8.0f} ms ({baseline / fast:.1f}x)" if fast else f"{'not installed':>17}")
+            print(f"{size:>8}  " + "  ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
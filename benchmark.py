@@ -0,0 +1,358 @@
+"""
+Load-test harness for the Users, Books and Portal services.
+
+Boots the three services on spare ports against fresh SQLite files, seeds them
+through the bulk import endpoints, then drives a weighted mix of borrow,
+return, list, search and portal traffic at a target request rate (open loop:
+requests are issued on schedule whether or not earlier ones have finished).
+Throughput and p50/p95/p99 latency per endpoint are printed and written as JSON
+under ``bench_results/`` so runs can be compared across commits.
+
+    python benchmark.py --users 2000 --books 50000 --rate 200 --duration 30
+    python benchmark.py --compare bench_results/a.json bench_results/b.json
+
+``--replay FILE`` replays NDJSON request records instead of synthesizing traffic,
+one per line: ``{"name": "borrow", "service": "books", "method": "POST",
+"path": "/api/borrow", "json": {"user_id": 1, "book_id": 7}}``.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = "borrow=3,return=3,books_page=4,search=3,user_loans=2,available=1,portal_books=1,portal_loans=1"
+WORDS = ["river", "stone", "night", "garden", "empire", "shadow", "winter", "machine", "ocean", "letters",
+         "history", "secret", "city", "forest", "light", "war", "peace", "journey", "silver", "glass"]
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Services:
+    """The three services running as subprocesses against databases in a temporary directory."""
+
+    def __init__(self, base_port: int, profile: str = None, workers: int = None, async_books: bool = False):
+        self.workers = workers
+        self.async_books = async_books
+        self.tmp = tempfile.TemporaryDirectory(prefix="library-bench-")
+        self.urls = {
+            "users": f"http://127.0.0.1:{base_port + 1}",
+            "books": f"http://127.0.0.1:{base_port + 2}",
+            "portal": f"http://127.0.0.1:{base_port}",
+        }
+        self.env = dict(
+            os.environ,
+            USERS_PORT=str(base_port + 1),
+            BOOKS_PORT=str(base_port + 2),
+            PORTAL_PORT=str(base_port),
+            USERS_DATABASE_URI=f"sqlite:///{os.path.join(self.tmp.name, 'users.db')}",
+            BOOKS_DATABASE_URI=f"sqlite:///{os.path.join(self.tmp.name, 'books.db')}",
+            USERS_API_URL=self.urls["users"],
+            BOOKS_API_URL=self.urls["books"],
+            RATE_LIMITS="borrow=1000000/second",
+        )
+        if profile:
+            self.env["LIBRARY_DB_PROFILE"] = profile
+        self.procs = []
+
+    def start(self) -> None:
+        for script, name, probe in (("users_service.py", "users", "/api/health"),
+                                    ("books_service.py", "books", "/"),
+                                    ("portal_service.py", "portal", "/about")):
+            log = open(os.path.join(self.tmp.name, f"{name}.log"), "w")
+            command = [sys.executable, script]
+            if self.workers:
+                command = [sys.executable, "serve.py", name, "--workers", str(self.workers)]
+            if name == "books" and self.async_books:
+                command = [sys.executable, "books_async.py"]
+            self.procs.append(subprocess.Popen(command, cwd=HERE, env=self.env, stdout=log, stderr=subprocess.STDOUT))
+            self._wait_ready(self.urls[name] + probe, name)
+
+    def _wait_ready(self, url: str, name: str, timeout: float = 30.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(url, timeout=1).status_code < 500:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{name} service did not start; see {self.tmp.name}/{name}.log")
+
+    def stop(self) -> None:
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self.tmp.cleanup()
+
+
+def seed(urls: dict, users: int, books: int, loan_fraction: float) -> dict:
+    """Load users and books through the import endpoints and open an initial set of loans."""
+    rng = random.Random(42)
+    user_body = "".join(json.dumps({"name": f"User {i}", "email": f"user{i}@bench.org"}) + "\n" for i in range(users))
+    report = requests.post(f"{urls['users']}/api/users/import", data=user_body.encode(),
+                           headers={"Content-Type": "application/x-ndjson"}, timeout=600).json()
+    if report["failed"]:
+        raise RuntimeError(f"user seeding failed: {report['errors'][:3]}")
+    book_body = "".join(
+        json.dumps({"title": " ".join(rng.sample(WORDS, 3)).title() + f" {i}", "author": f"Author {i % 997}"}) + "\n"
+        for i in range(books)
+    )
+    report = requests.post(f"{urls['books']}/api/books/import", data=book_body.encode(),
+                           headers={"Content-Type": "application/x-ndjson"}, timeout=600).json()
+    if report["failed"]:
+        raise RuntimeError(f"book seeding failed: {report['errors'][:3]}")
+    borrowed = set(rng.sample(range(1, books + 1), int(books * loan_fraction)))
+    pending = sorted(borrowed)
+    for start in range(0, len(pending), 100):
+        requests.post(f"{urls['books']}/api/borrow/batch", timeout=60, json={
+            "user_id": rng.randint(1, users), "book_ids": pending[start:start + 100], "days": rng.randint(1, 21),
+        })
+    return {"users": users, "books": books, "borrowed": borrowed}
+
+
+class TrafficModel:
+    """Synthesizes requests and tracks which books are on loan so borrows and returns mostly succeed."""
+
+    def __init__(self, seeded: dict, mix: dict, seed_value: int = 7):
+        self.users = seeded["users"]
+        self.books = seeded["books"]
+        self.borrowed = set(seeded["borrowed"])
+        self.available = set(range(1, self.books + 1)) - self.borrowed
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.rng = random.Random(seed_value)
+        self.lock = threading.Lock()
+
+    def _take(self, pool: set):
+        if not pool:
+            return self.rng.randint(1, self.books)
+        book_id = self.rng.choice(tuple(pool)) if len(pool) < 1000 else pool.pop()
+        pool.discard(book_id)
+        return book_id
+
+    def next_request(self) -> dict:
+        with self.lock:
+            name = self.rng.choices(self.names, self.weights)[0]
+            user_id = self.rng.randint(1, self.users)
+            if name == "borrow":
+                book_id = self._take(self.available)
+                return {"name": name, "service": "books", "method": "POST", "path": "/api/borrow",
+                        "json": {"user_id": user_id, "book_id": book_id, "days": 14}, "book_id": book_id}
+            if name == "return":
+                book_id = self._take(self.borrowed)
+                return {"name": name, "service": "books", "method": "POST", "path": "/api/return",
+                        "json": {"book_id": book_id}, "book_id": book_id}
+            if name == "books_page":
+                after = self.rng.randint(0, max(0, self.books - 50))
+                return {"name": name, "service": "books", "method": "GET", "path": f"/api/books?after_id={after}&limit=50"}
+            if name == "search":
+                return {"name": name, "service": "books", "method": "GET",
+                        "path": f"/api/books?q={self.rng.choice(WORDS)}&limit=20"}
+            if name == "user_loans":
+                return {"name": name, "service": "books", "method": "GET", "path": f"/api/loans?user_id={user_id}"}
+            if name == "available":
+                return {"name": name, "service": "books", "method": "GET", "path": "/api/books/available?limit=50"}
+            if name == "portal_books":
+                return {"name": name, "service": "portal", "method": "GET", "path": "/books"}
+            if name == "portal_loans":
+                return {"name": name, "service": "portal", "method": "GET", "path": f"/loans?user_id={user_id}"}
+            raise ValueError(f"Unknown request type {name!r}")
+
+    def completed(self, req: dict, status: int) -> None:
+        book_id = req.get("book_id")
+        if book_id is None:
+            return
+        with self.lock:
+            if req["name"] == "borrow":
+                (self.borrowed if status == 201 else self.available).add(book_id)
+            elif req["name"] == "return":
+                (self.available if status == 200 else self.borrowed).add(book_id)
+
+
+def run_load(urls: dict, next_request, rate: float, duration: float, concurrency: int, on_complete=None) -> dict:
+    """Issue requests at ``rate`` per second for ``duration`` seconds; return raw samples per endpoint."""
+    local = threading.local()
+    samples, statuses, lock = {}, {}, threading.Lock()
+
+    def session() -> requests.Session:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.mount("http://", HTTPAdapter(pool_maxsize=4))
+        return local.session
+
+    def issue(req: dict, scheduled: float) -> None:
+        try:
+            resp = session().request(req["method"], urls[req["service"]] + req["path"], json=req.get("json"), timeout=30)
+            status = resp.status_code
+        except requests.RequestException:
+            status = 0
+        # Latency is measured from the scheduled start, so queueing delay counts (no coordinated omission).
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            samples.setdefault(req["name"], []).append(elapsed)
+            counts = statuses.setdefault(req["name"], {})
+            counts[str(status)] = counts.get(str(status), 0) + 1
+        if on_complete:
+            on_complete(req, status)
+
+    started = time.perf_counter()
+    interval = 1.0 / rate
+    issued = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            scheduled = started + issued * interval
+            if scheduled - started >= duration:
+                break
+            req = next_request()
+            if req is None:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(issue, req, scheduled)
+            issued += 1
+    wall = time.perf_counter() - started
+    return {"samples": samples, "statuses": statuses, "wall_seconds": wall, "issued": issued}
+
+
+def summarize(raw: dict) -> dict:
+    endpoints = {}
+    for name, values in sorted(raw["samples"].items()):
+        values.sort()
+        endpoints[name] = {
+            "count": len(values),
+            "throughput_rps": round(len(values) / raw["wall_seconds"], 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+            "statuses": raw["statuses"][name],
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {"total_requests": total, "throughput_rps": round(total / raw["wall_seconds"], 2), "endpoints": endpoints}
+
+
+def print_summary(result: dict) -> None:
+    print(f"\n{result['summary']['total_requests']} requests, {result['summary']['throughput_rps']} req/s")
+    print(f"{'endpoint':<14}{'count':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for name, e in result["summary"]["endpoints"].items():
+        print(f"{name:<14}{e['count']:>8}{e['throughput_rps']:>9}{e['p50_ms']:>9}{e['p95_ms']:>9}{e['p99_ms']:>9}  {e['statuses']}")
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    print(f"{'endpoint':<14}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}{'req/s':>16}")
+    for name in sorted(set(old["summary"]["endpoints"]) | set(new["summary"]["endpoints"])):
+        a = old["summary"]["endpoints"].get(name)
+        b = new["summary"]["endpoints"].get(name)
+        if not a or not b:
+            print(f"{name:<14} only in {'new' if b else 'old'} run")
+            continue
+        cells = [f"{a[k]:>8}->{b[k]:<8}" for k in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")]
+        print(f"{name:<14}" + "".join(cells))
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--loan-fraction", type=float, default=0.2, help="share of books on loan after seeding")
+    parser.add_argument("--rate", type=float, default=100, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of traffic")
+    parser.add_argument("--concurrency", type=int, default=64, help="maximum requests in flight")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted request mix, name=weight,...")
+    parser.add_argument("--replay", help="NDJSON file of request records to replay instead of synthesizing")
+    parser.add_argument("--profile", help="LIBRARY_DB_PROFILE for both backends")
+    parser.add_argument("--workers", type=int, help="run each service through serve.py with this many workers "
+                                                    "instead of the development server")
+    parser.add_argument("--async-books", action="store_true", help="run the Books Service with books_async.py")
+    parser.add_argument("--base-port", type=int, default=18000, help="portal port; users and books use the next two")
+    parser.add_argument("--out", default=os.path.join(HERE, "bench_results"))
+    parser.add_argument("--label", default="", help="free-form tag stored with the results")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    services = Services(args.base_port, args.profile, args.workers, args.async_books)
+    try:
+        print("Starting services ...")
+        services.start()
+        print(f"Seeding {args.users} users, {args.books} books ...")
+        started = time.perf_counter()
+        seeded = seed(services.urls, args.users, args.books, args.loan_fraction)
+        seed_seconds = time.perf_counter() - started
+        if args.replay:
+            with open(args.replay) as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            replay = iter(records * max(1, int(args.rate * args.duration) // max(1, len(records)) + 1))
+            raw = run_load(services.urls, lambda: next(replay, None), args.rate, args.duration, args.concurrency)
+        else:
+            model = TrafficModel(seeded, parse_mix(args.mix))
+            print(f"Running {args.rate:g} req/s for {args.duration:g}s ...")
+            raw = run_load(services.urls, model.next_request, args.rate, args.duration, args.concurrency, model.completed)
+    finally:
+        services.stop()
+
+    result = {
+        "commit": git_commit(),
+        "label": args.label,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+        "seed_seconds": round(seed_seconds, 2),
+        "summary": summarize(raw),
+    }
+    print_summary(result)
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{result['timestamp'].replace(':', '')}-{result['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+Asyncio front end for the Books Service, for high-concurrency borrow traffic.
+
+    python books_async.py --port 5050 --db-threads 4
+
+Serves exactly the routes and JSON of books_service.py with one event loop
+(aiohttp) in front of a small pool of database threads:
+
+- Borrow and hold requests first check the borrower against the Users Service with a
+  non-blocking client. The answer goes into the same cache the Books Service
+  reads, and concurrent checks of one user share a single call. Thousands of
+  borrows can wait on the Users Service without holding a thread each.
+- The request is then run by the Flask app on a database thread, so
+  validation, rate limits, transactions and response bodies are those of
+  books_service.py. Streamed listings are relayed chunk by chunk and request
+  bodies (bulk imports) are read from the socket as the app consumes them.
+- Event streams (``/api/events/stream``) are served on the event loop and use
+  a database thread only to read each batch of events, so an open stream
+  holds no thread.
+
+Requires aiohttp (``pip install -r requirements-serve.txt``).
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+import books_service
+from users_client import UsersServiceUnavailable
+
+BORROW_PATHS = ("/api/borrow", "/api/borrow/batch", "/api/holds")
+EVENT_STREAM_PATH = "/api/events/stream"
+QUEUE_CHUNKS = 16
+# Seconds a database thread waits for a client too slow to make room in its response queue.
+SEND_TIMEOUT = 30
+
+
+class _ClientGone(Exception):
+    """Raised on a database thread when nobody reads its response any more."""
+
+
+class AsyncUsersClient:
+    """Non-blocking ``user_exists`` sharing a ``UsersClient``'s cache and circuit breaker."""
+
+    def __init__(self, client):
+        self.client = client
+        self._session = None
+        self._inflight = {}
+
+    async def start(self) -> None:
+        connect_timeout, read_timeout = self.client.timeout
+        self._session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+            connector=aiohttp.TCPConnector(limit=100),
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def user_exists(self, user_id) -> bool:
+        key = str(user_id)
+        cached = self.client.cache.get(key)
+        if cached is not None:
+            return cached
+        lookup = self._inflight.get(key)
+        if lookup is None:
+            lookup = self._inflight[key] = asyncio.ensure_future(self._lookup(key))
+            lookup.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(lookup)
+
+    async def _lookup(self, key: str) -> bool:
+        if not self.client.breaker.allow():
+            raise UsersServiceUnavailable("Users service circuit is open.")
+        try:
+            async with self._session.get(f"{self.client.base_url}/api/users/{key}") as resp:
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            self.client.breaker.record_failure()
+            raise UsersServiceUnavailable(str(exc)) from exc
+        return self.client.record_answer(key, status)
+
+
+class _BodyReader:
+    """Blocking file-like view of an aiohttp request body, for the app's ``wsgi.input``."""
+
+    def __init__(self, content, loop):
+        self.content = content
+        self.loop = loop
+        # Bytes read past the end of the last line a bounded readline returned.
+        self.pending = b""
+
+    def _wait(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def read(self, size: int = -1) -> bytes:
+        data, self.pending = self.pending, b""
+        if size is None or size < 0:
+            return data + self._wait(self.content.read(-1))
+        if data:
+            self.pending = data[size:]
+            return data[:size]
+        return self._wait(self.content.read(size))
+
+    def readline(self, size: int = -1) -> bytes:
+        """Read up to and including the next newline, holding at most ``size`` bytes of it when given."""
+        limit = size if size is not None and size >= 0 else None
+        line = b""
+        while limit is None or len(line) < limit:
+            chunk, self.pending = self.pending or self._wait(self.content.readany()), b""
+            if not chunk:
+                break
+            end = chunk.find(b"\n") + 1 or len(chunk)
+            if limit is not None:
+                end = min(end, limit - len(line))
+            line += chunk[:end]
+            self.pending = chunk[end:]
+            if line.endswith(b"\n"):
+                break
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _environ(request: web.Request, body) -> dict:
+    host, _, port = (request.host or "localhost").partition(":")
+    environ = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": request.path,
+        "QUERY_STRING": request.query_string,
+        "SERVER_NAME": host,
+        "SERVER_PORT": port or ("443" if request.secure else "80"),
+        "SERVER_PROTOCOL": f"HTTP/{request.version.major}.{request.version.minor}",
+        "REMOTE_ADDR": request.remote or "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": request.scheme,
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        # The reader returns b"" at the end of the body, chunked or not.
+        "wsgi.input_terminated": True,
+    }
+    for name, value in request.headers.items():
+        key = name.upper().replace("-", "_")
+        if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[key] = value
+        else:
+            key = "HTTP_" + key
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class BooksFrontEnd:
+    """aiohttp application relaying requests to the Flask app on a fixed pool of database threads."""
+
+    def __init__(self, flask_app, users: AsyncUsersClient, db_threads: int):
+        self.flask_app = flask_app
+        self.users = users
+        self.pool = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix="books-db")
+        # Replaced by a fresh event each time a commit in this process records events.
+        self.events_changed = None
+        self.stopping = False
+
+    def _run_app(self, environ: dict, loop, queue: asyncio.Queue, relay, gone: threading.Event) -> None:
+        # Runs on a database thread: the whole response, including a streamed body,
+        # is produced on this one thread because Flask's contexts are bound to it.
+        def put(item):
+            if gone.is_set():
+                raise _ClientGone
+            sent = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            try:
+                sent.result(SEND_TIMEOUT)
+            except TimeoutError:
+                sent.cancel()
+                gone.set()
+                # Drop the connection rather than hold this thread for the slow client.
+                loop.call_soon_threadsafe(relay.cancel)
+                raise _ClientGone from None
+
+        def start_response(status, headers, exc_info=None):
+            put(("start", status, headers))
+            return lambda data: put(("chunk", data))
+
+        try:
+            body = self.flask_app.wsgi_app(environ, start_response)
+            try:
+                for chunk in body:
+                    if chunk:
+                        put(("chunk", chunk))
+            finally:
+                # Also stops a streamed body when the client has gone, running its cleanup.
+                if hasattr(body, "close"):
+                    body.close()
+        except _ClientGone:
+            return
+        except BaseException as exc:
+            last = ("error", exc)
+        else:
+            last = ("end",)
+        try:
+            put(last)
+        except _ClientGone:
+            pass
+
+    async def _relay(self, request: web.Request, body) -> web.StreamResponse:
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(QUEUE_CHUNKS)
+        gone = threading.Event()
+        job = loop.run_in_executor(
+            self.pool, self._run_app, _environ(request, body), loop, queue, asyncio.current_task(), gone
+        )
+        response = None
+        item = (None,)
+        try:
+            while True:
+                item = await queue.get()
+                if item[0] == "start":
+                    code, _, reason = item[1].partition(" ")
+                    response = web.StreamResponse(status=int(code), reason=reason)
+                    for name, value in item[2]:
+                        response.headers.add(name, value)
+                    await response.prepare(request)
+                elif item[0] == "chunk":
+                    await response.write(item[1])
+                elif item[0] == "error":
+                    raise item[1]
+                else:
+                    break
+            await response.write_eof()
+            await job
+            return response
+        except ConnectionResetError:
+            # The client hung up; nothing more to send.
+            return response
+        finally:
+            if item[0] not in ("end", "error"):
+                # The client went away or the handler was cancelled: the database thread's next put
+                # raises, which closes the app's response. Emptying the queue frees a put it is blocked in.
+                gone.set()
+                while not queue.empty():
+                    queue.get_nowait()
+
+    def _in_app(self, func, *args):
+        with self.flask_app.app_context():
+            return func(*args)
+
+    def _events_recorded(self) -> None:
+        changed, self.events_changed = self.events_changed, asyncio.Event()
+        changed.set()
+
+    async def stream_events(self, request: web.Request) -> web.StreamResponse:
+        """books_service's ``/api/events/stream``, waiting between batches on the event loop instead of a thread."""
+        feed = books_service.feed
+        since = _int_or_none(request.headers.get("Last-Event-ID"))
+        if since is None:
+            since = _int_or_none(request.query.get("since"))
+        release_slot = feed.open_stream()
+        if release_slot is None:
+            return web.json_response({"error": "Too many event streams."}, status=503, headers={"Retry-After": "5"})
+        loop = asyncio.get_running_loop()
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream; charset=utf-8", "Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+        })
+        try:
+            await response.prepare(request)
+            await response.write(f"retry: {books_service.STREAM_RETRY_MS}\n\n".encode())
+            since, reset = await loop.run_in_executor(self.pool, self._in_app, books_service.event_stream_start, since)
+            if reset:
+                await response.write(reset.encode())
+                await response.write_eof()
+                return response
+            started = last_sent = loop.time()
+            while loop.time() - started < books_service.STREAM_MAX_SECONDS and not self.stopping:
+                changed = self.events_changed
+                text, since, more = await loop.run_in_executor(
+                    self.pool, self._in_app, books_service.event_stream_batch, since
+                )
+                if text:
+                    await response.write(text.encode())
+                    last_sent = loop.time()
+                    if more:
+                        continue
+                elif loop.time() - last_sent >= feed.keepalive:
+                    await response.write(b": keep-alive\n\n")
+                    last_sent = loop.time()
+                try:
+                    await asyncio.wait_for(changed.wait(), feed.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            await response.write_eof()
+            return response
+        except ConnectionResetError:
+            return response
+        finally:
+            release_slot()
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        if request.method == "POST" and request.path in BORROW_PATHS:
+            raw = await request.read()
+            try:
+                user_id = json.loads(raw or b"{}").get("user_id")
+            except (ValueError, AttributeError):
+                user_id = None
+            if user_id and isinstance(user_id, (int, str)) and not isinstance(user_id, bool):
+                try:
+                    # Leaves the answer in the cache the borrow view reads, so its check does not block.
+                    await self.users.user_exists(user_id)
+                except UsersServiceUnavailable:
+                    return web.json_response({"error": "Users service unavailable."}, status=503)
+            return await self._relay(request, io.BytesIO(raw))
+        return await self._relay(request, _BodyReader(request.content, asyncio.get_running_loop()))
+
+    async def on_startup(self, app) -> None:
+        await self.users.start()
+        loop = asyncio.get_running_loop()
+        self.events_changed = asyncio.Event()
+        self._wake_streams = lambda: loop.call_soon_threadsafe(self._events_recorded)
+        books_service.feed.add_listener(self._wake_streams)
+        await loop.run_in_executor(self.pool, self._migrate)
+        books_service.archiver.start()
+
+    async def on_shutdown(self, app) -> None:
+        # End the event streams now instead of letting them run into the shutdown timeout.
+        self.stopping = True
+        self._events_recorded()
+
+    def _migrate(self) -> None:
+        with self.flask_app.app_context():
+            books_service.migrate_schema()
+
+    async def on_cleanup(self, app) -> None:
+        books_service.feed.remove_listener(self._wake_streams)
+        await asyncio.get_running_loop().run_in_executor(None, books_service.archiver.stop)
+        await self.users.close()
+        self.pool.shutdown(wait=True)
+
+
+def make_app(db_threads: int = 4) -> web.Application:
+    front = BooksFrontEnd(books_service.app, AsyncUsersClient(books_service.users_client), db_threads)
+    app = web.Application(client_max_size=0)
+    app.on_startup.append(front.on_startup)
+    app.on_shutdown.append(front.on_shutdown)
+    app.on_cleanup.append(front.on_cleanup)
+    app.router.add_get(EVENT_STREAM_PATH, front.stream_events)
+    app.router.add_route("*", "/{tail:.*}", front.handle)
+    return app
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=os.environ.get("LIBRARY_BIND", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("BOOKS_PORT", 5050)))
+    parser.add_argument("--db-threads", type=int, default=4,
+                        help="threads running the app and its database work; SQLite serializes writers anyway")
+    args = parser.parse_args(argv)
+    web.run_app(make_app(args.db_threads), host=args.host, port=args.port, shutdown_timeout=30)
+
+
+if __name__ == "__main__":
+    main()
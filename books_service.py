@@ -1,24 +1,75 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, make_response, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-import requests
-from datetime import datetime, timedelta
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from functools import wraps
+import click
+import os
+import re
+import threading
 import time
 
+from change_versions import ChangeVersions
+from circulation import Circulation
+from bulk_import import is_csv, iter_records, run_import
+from instrumentation import Metrics
+from pagination import BATCH_SIZE, MAX_PAGE_SIZE, keyset_page, keyset_page_by, list_response, parse_fields, parse_ids, parse_sort
+from rate_limiter import RateLimiter
+from serialization import JSONProvider, as_rows, isoformat
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from storage import configure_sqlite, configure_storage, retry_on_busy
+from users_client import UsersClient, UsersServiceUnavailable
+
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///books.db'
+app.json = JSONProvider(app)
+configure_storage(app, 'sqlite:///books.db', 'BOOKS_DATABASE_URI')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
+configure_sqlite(app, db)
+versions = ChangeVersions(db)
+circulation = Circulation(db)
 
-rate_limit = {}
+limiter = RateLimiter()
+users_client = UsersClient()
+metrics = Metrics()
+metrics.init_app(app, db)
+metrics.instrument_session(users_client.session, {users_client.base_url: "users"})
+MAX_BATCH_SIZE = 100
+
+class Title(db.Model):
+    """A catalogue title; its physical copies are Book rows with the same title and author."""
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(120), nullable=False)
+    author = db.Column(db.String(80), nullable=False)
+    copies = db.Column(db.Integer, nullable=False, default=0)
+    # Kept in step with the copies' status by the statements that borrow, return, add and remove them.
+    available_copies = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index("ix_title_title_author", title, author, unique=True),
+        # Titles with a copy on the shelf, in id order.
+        db.Index("ix_title_available", id, sqlite_where=available_copies > 0),
+        db.CheckConstraint("available_copies BETWEEN 0 AND copies", name="ck_title_available_copies"),
+    )
+    def to_dict(self) -> dict:
+        return {"id": self.id, "title": self.title, "author": self.author, "copies": self.copies,
+                "available_copies": self.available_copies}
 
 class Book(db.Model):
-    """Book model."""
+    """Book model: one physical copy of a Title."""
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(120), nullable=False)
     author = db.Column(db.String(80), nullable=False, default="Unknown")
     status = db.Column(db.String(16), nullable=False, default="AVAILABLE")
+    title_id = db.Column(db.Integer, db.ForeignKey("title.id"), nullable=True)
+    __table_args__ = (
+        db.Index("ix_book_status", status),
+        # An available copy of a title.
+        db.Index("ix_book_title_status", title_id, status),
+    )
     def to_dict(self) -> dict:
-        return {"id": self.id, "title": self.title, "author": self.author, "status": self.status}
+        return {"id": self.id, "title": self.title, "author": self.author, "status": self.status,
+                "title_id": self.title_id}
 
 class Loan(db.Model):
     """Loan model."""
@@ -28,16 +79,295 @@ class Loan(db.Model):
     borrowed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     returned_at = db.Column(db.DateTime, nullable=True)
     due_date = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (
+        db.Index("ix_loan_user", user_id),
+        # Open loans only: what borrow/return probe for on every request.
+        db.Index("ix_loan_open_book", book_id, sqlite_where=returned_at.is_(None)),
+        # Serves overdue lookups (returned_at IS NULL, due_date range) and archiving by return date.
+        db.Index("ix_loan_returned_due", returned_at, due_date),
+        # Open loans in id order, for the keyset-paged open-loan listing.
+        db.Index("ix_loan_open_id", id, sqlite_where=returned_at.is_(None)),
+        # A patron's open loans by due date, for per-user overdue and due-soon lists.
+        db.Index("ix_loan_open_user_due", user_id, due_date, sqlite_where=returned_at.is_(None)),
+    )
     def to_dict(self) -> dict:
         return {
             "id": self.id,
             "user_id": self.user_id,
             "book_id": self.book_id,
-            "borrowed_at": self.borrowed_at,
-            "returned_at": self.returned_at,
-            "due_date": self.due_date
+            "borrowed_at": isoformat(self.borrowed_at),
+            "returned_at": isoformat(self.returned_at),
+            "due_date": isoformat(self.due_date)
         }
 
+class LoanArchive(db.Model):
+    """Returned loan moved out of the loan table by an archive pass; keeps its loan id."""
+    __tablename__ = "loan_archive"
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    book_id = db.Column(db.Integer, nullable=False)
+    borrowed_at = db.Column(db.DateTime, nullable=False)
+    returned_at = db.Column(db.DateTime, nullable=False)
+    due_date = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (
+        # Full-history listings only filter by user.
+        db.Index("ix_loan_archive_user", user_id),
+    )
+
+class BookEvent(db.Model):
+    """Entry in the append-only change log of books and loans; ``seq`` is never reused."""
+    __tablename__ = "book_event"
+    seq = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(16), nullable=False)
+    book_id = db.Column(db.Integer, nullable=False)
+    loan_id = db.Column(db.Integer, nullable=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    # Book fields after book_created / book_updated, so consumers need not re-fetch the book.
+    title = db.Column(db.String(120), nullable=True)
+    author = db.Column(db.String(80), nullable=True)
+    at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class Hold(db.Model):
+    """A patron's place in the queue for a borrowed book; the lowest position is served first."""
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    # Loan length in days once the hold is filled; None for no due date.
+    days = db.Column(db.Integer, nullable=True)
+    placed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (
+        # The head of a book's queue on return, and how many holds are ahead of one.
+        db.Index("ix_hold_book_position", book_id, position, unique=True),
+        # One hold per patron and book.
+        db.Index("ix_hold_user_book", user_id, book_id, unique=True),
+        # A patron's holds in id order.
+        db.Index("ix_hold_user", user_id),
+    )
+    def to_dict(self) -> dict:
+        return {"id": self.id, "book_id": self.book_id, "user_id": self.user_id, "days": self.days,
+                "placed_at": isoformat(self.placed_at)}
+
+LOAN_COLUMNS = (Loan.id, Loan.user_id, Loan.book_id, Loan.borrowed_at, Loan.returned_at, Loan.due_date)
+ARCHIVE_COLUMNS = (LoanArchive.id, LoanArchive.user_id, LoanArchive.book_id, LoanArchive.borrowed_at,
+                   LoanArchive.returned_at, LoanArchive.due_date)
+EVENT_COLUMNS = (BookEvent.seq, BookEvent.type, BookEvent.book_id, BookEvent.loan_id, BookEvent.user_id,
+                 BookEvent.title, BookEvent.author, BookEvent.at)
+HOLD_COLUMNS = (Hold.id, Hold.book_id, Hold.user_id, Hold.days, Hold.placed_at)
+
+
+def _create_indexes(*names):
+    """Migration creating the model indexes ``names`` where an existing books.db lacks them.
+
+    Each migration names its own indexes, so an old database never gets an index on
+    a column that a later migration adds.
+    """
+    def create(conn):
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in names:
+                    index.create(conn, checkfirst=True)
+    return create
+
+def _create_book_search_index(conn):
+    # External-content FTS5 index over book title/author, kept in sync by triggers.
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+        "title, author, content='book', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN "
+        "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN "
+        "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE OF title, author ON book BEGIN "
+        "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+        "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END"
+    )
+    conn.exec_driver_sql("INSERT INTO book_fts(book_fts) VALUES ('rebuild')")
+
+def _split_titles(conn):
+    # Group existing copies into titles by (title, author) and point each copy at its title.
+    if "title_id" not in {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(book)")}:
+        conn.exec_driver_sql("ALTER TABLE book ADD COLUMN title_id INTEGER REFERENCES title (id)")
+    conn.exec_driver_sql(
+        "INSERT INTO title (title, author, copies, available_copies) "
+        "SELECT title, author, count(*), sum(status = 'AVAILABLE') FROM book WHERE title_id IS NULL "
+        "GROUP BY title, author ON CONFLICT (title, author) DO UPDATE SET "
+        "copies = copies + excluded.copies, available_copies = available_copies + excluded.available_copies"
+    )
+    conn.exec_driver_sql(
+        "UPDATE book SET title_id = (SELECT id FROM title WHERE title.title = book.title AND title.author = book.author) "
+        "WHERE title_id IS NULL"
+    )
+    _create_indexes("ix_book_title_status")(conn)
+
+def _backfill_circulation(conn):
+    circulation.backfill(conn, [Loan.__table__, LoanArchive.__table__])
+
+# Schema migrations, applied in order; PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    _create_indexes("ix_book_status", "ix_loan_user", "ix_loan_open_book", "ix_loan_returned_due"),
+    _create_book_search_index,
+    _create_indexes("ix_loan_open_user_due"),
+    _backfill_circulation,
+    _split_titles,
+    _create_indexes("ix_loan_open_id", "ix_hold_user"),
+]
+
+def migrate_schema():
+    """Create missing tables and bring an existing books.db up to the current schema."""
+    db.create_all()
+    with db.engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+
+# Hot queries, built by the same functions the endpoints use, and the index each one must use.
+_SINCE, _BEFORE = datetime(1999, 1, 1), datetime(2000, 1, 1)
+HOT_QUERIES = [
+    ("open loan for book", lambda: _open_loans_of([1]), "ix_loan_open_book"),
+    ("open loans for books", lambda: _open_loans_of([1, 2]), "ix_loan_open_book"),
+    ("own open loan", lambda: _own_open_loan(1, 1), "ix_loan_open_book"),
+    ("loans for user", lambda: keyset_page(loans_query(1), Loan.id, 0), "ix_loan_user"),
+    ("open loans", lambda: keyset_page(loans_query(open_filter="true"), Loan.id, 0), "ix_loan_open_id"),
+    ("overdue loans", lambda: keyset_page_by(open_loans_due(_BEFORE, _SINCE), Loan.due_date, Loan.id, (_SINCE, 0)),
+     "ix_loan_returned_due (returned_at=? AND due_date>? AND due_date<?)"),
+    ("overdue loans for user",
+     lambda: keyset_page_by(open_loans_due(_BEFORE, _SINCE, 1), Loan.due_date, Loan.id, (_SINCE, 0)),
+     "ix_loan_open_user_due (user_id=? AND due_date>? AND due_date<?)"),
+    ("available books", lambda: keyset_page(available_books_query(), Book.id, 0), "ix_book_status"),
+    ("available titles", lambda: keyset_page(available_titles_query(), Title.id, 0), "ix_title_available"),
+    ("available copy of title", lambda: _available_copy(1), "ix_book_title_status"),
+    ("loans to archive", lambda: _loans_to_archive(_BEFORE, ARCHIVE_BATCH_SIZE), "ix_loan_returned_due"),
+    ("archived loans for user", lambda: keyset_page(archived_loans_query(1), LoanArchive.id, 0),
+     "ix_loan_archive_user"),
+    ("most borrowed books", lambda: circulation.top_books_query(10), "ix_circulation_book_borrows"),
+    ("events since", lambda: _events_query(1), "INTEGER PRIMARY KEY"),
+    ("hold queue heads", lambda: _hold_queue_heads([1, 2]), "ix_hold_book_position"),
+    ("holds ahead", lambda: _holds_ahead(1, 5), "ix_hold_book_position"),
+    ("holds for user", lambda: keyset_page(holds_query(user_id=1), Hold.id, 0), "ix_hold_user"),
+]
+
+def explain_hot_queries() -> list:
+    """Return (name, plan, expected index, ok) for each hot query via EXPLAIN QUERY PLAN.
+
+    A plan is ok when it uses the expected index and sorts nothing in a temp B-tree.
+    """
+    results = []
+    with db.engine.connect() as conn:
+        for name, build, index in HOT_QUERIES:
+            statement = build()
+            statement = getattr(statement, "statement", statement)
+            sql = str(statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+            plan = " | ".join(row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql))
+            results.append((name, plan, index, index in plan and "TEMP B-TREE" not in plan))
+    return results
+
+@app.cli.command("migrate-db")
+def migrate_db_command():
+    """Apply pending schema migrations to books.db."""
+    migrate_schema()
+    click.echo("books.db schema is up to date.")
+
+@app.cli.command("import-books")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def import_books_command(path):
+    """Bulk-load books from an NDJSON or .csv file."""
+    with open(path, "rb") as f:
+        report = import_books(f, is_csv(filename=path))
+    click.echo(f"Inserted {report['inserted']}, failed {report['failed']}.")
+    for error in report["errors"]:
+        click.echo(f"  line {error['line']}: {error['error']}")
+
+@app.cli.command("archive-loans")
+@click.option("--older-than-days", type=int, default=None, help="defaults to LOAN_ARCHIVE_DAYS (90)")
+def archive_loans_command(older_than_days):
+    """Move returned loans older than the archive age to loan_archive and prune old change log events."""
+    days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    moved = archive_returned_loans(datetime.utcnow() - timedelta(days=days))
+    click.echo(f"Archived {moved} loans returned more than {days} days ago.")
+    pruned = prune_events(datetime.utcnow() - timedelta(days=EVENT_RETENTION_DAYS))
+    click.echo(f"Pruned {pruned} change log events older than {EVENT_RETENTION_DAYS} days.")
+
+@app.cli.command("backfill-stats")
+def backfill_stats_command():
+    """Rebuild the circulation rollups from the loan and loan_archive tables."""
+    with db.engine.begin() as conn:
+        _backfill_circulation(conn)
+    click.echo("Circulation rollups rebuilt.")
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Fail if a hot query does not use its index; migrates books.db first, so a fresh checkout can run it."""
+    migrate_schema()
+    results = explain_hot_queries()
+    for name, plan, index, ok in results:
+        click.echo(f"{'ok  ' if ok else 'FAIL'} {name}: {plan}")
+    if not all(ok for *_, ok in results):
+        raise SystemExit(1)
+
+@app.cli.command("stress-borrow")
+@click.option("--threads", type=int, default=16, help="concurrent borrowers")
+@click.option("--rounds", type=int, default=50, help="times the borrowers race for the book")
+def stress_borrow_command(threads, rounds):
+    """Fail unless each race of many threads for one book lends it exactly once.
+
+    Adds a book and writes loans and events; run it against a scratch BOOKS_DATABASE_URI.
+    """
+    migrate_schema()
+    key = ("stress-borrow", "stress-borrow")
+    book_id = db.session.execute(db.insert(Book).returning(Book.id), {
+        "title": key[0], "author": key[1], "status": "AVAILABLE", "title_id": _add_copies({key: (1, 1)})[key],
+    }).scalar()
+    record_events([_book_event("book_created", book_id, *key)])
+    db.session.commit()
+    barrier = threading.Barrier(threads)
+    wins, errors = [0] * rounds, []
+    lock = threading.Lock()
+
+    def borrower(user_id):
+        with app.app_context():
+            try:
+                for number in range(rounds):
+                    barrier.wait()
+                    if borrow_books(user_id, [book_id])[0]["status"] == 201:
+                        with lock:
+                            wins[number] += 1
+                    barrier.wait()
+                    if user_id == 1:
+                        return_books([book_id])
+                    barrier.wait()
+            except threading.BrokenBarrierError:
+                pass
+            except Exception as exc:
+                errors.append(repr(exc))
+                barrier.abort()
+
+    workers = [threading.Thread(target=borrower, args=(user_id,)) for user_id in range(1, threads + 1)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    doubled = db.session.query(Loan.book_id, db.func.count()).filter(Loan.returned_at.is_(None)).group_by(
+        Loan.book_id
+    ).having(db.func.count() > 1).all()
+    bad_rounds = sum(1 for won in wins if won != 1)
+    click.echo(f"{rounds} rounds of {threads} borrowers on book {book_id}: {sum(wins)} loans, "
+               f"{bad_rounds} rounds without exactly one.")
+    for error in errors:
+        click.echo(f"  error: {error}")
+    for doubled_book_id, count in doubled:
+        click.echo(f"  book {doubled_book_id} has {count} open loans")
+    if errors or bad_rounds or doubled:
+        raise SystemExit(1)
+
 
 @app.route("/")
 def home():
@@ -58,6 +388,7 @@ def home():
         <tr><td>/api/books</td><td>GET, POST</td><td>List or add books</td></tr>
         <tr><td>/api/borrow</td><td>POST</td><td>Borrow a book</td></tr>
         <tr><td>/api/return</td><td>POST</td><td>Return a book</td></tr>
+        <tr><td>/api/borrow/batch, /api/return/batch</td><td>POST</td><td>Borrow or return a list of books</td></tr>
         <tr><td>/api/loans</td><td>GET</td><td>List loans</td></tr>
         <tr><td>/api/overdue</td><td>GET</td><td>List overdue loans</td></tr>
         <tr><td>/docs</td><td>GET</td><td>API documentation</td></tr>
@@ -83,96 +414,502 @@ def about():
     '''
     return html, 200
 
-@app.route("/api/books", methods=["POST"])
-def create_book():
-    data = request.get_json()
+def validate_book(data: dict):
+    """Return ``(fields, error)`` for a new book."""
     title = data.get("title")
-    author = data.get("author", "Unknown")
+    author = data.get("author") or "Unknown"
     if not title:
-        return jsonify({"error": "Missing title."}), 400
-    book = Book(title=title, author=author, status="AVAILABLE")
+        return None, "Missing title."
+    if not isinstance(title, str) or not isinstance(author, str):
+        return None, "Title and author must be strings."
+    return {"title": title, "author": author, "status": "AVAILABLE"}, None
+
+class EventFeed:
+    """Wakes this process's event streams when a transaction that recorded events commits.
+
+    Streams also poll, so events written by other processes arrive within ``poll_interval``.
+    """
+
+    def __init__(self, max_streams: int, keepalive: float = 5.0, poll_interval: float = 1.0):
+        self.keepalive = keepalive
+        self.poll_interval = poll_interval
+        self.streams = threading.BoundedSemaphore(max_streams)
+        self._changed = threading.Condition()
+        self._listeners = []
+
+    def open_stream(self):
+        """Take a stream slot and return a callable that frees it once, or None if every slot is taken."""
+        if not self.streams.acquire(blocking=False):
+            return None
+        held = [True]
+
+        def release() -> None:
+            if held and held.pop():
+                self.streams.release()
+        return release
+
+    def add_listener(self, callback) -> None:
+        """Also call ``callback()`` on every notify, from the committing thread; for streams that do not ``wait``."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback) -> None:
+        self._listeners.remove(callback)
+
+    def notify(self) -> None:
+        with self._changed:
+            self._changed.notify_all()
+        for callback in self._listeners:
+            callback()
+
+    def wait(self) -> None:
+        with self._changed:
+            self._changed.wait(self.poll_interval)
+
+# Each open stream holds a request thread (except under books_async.py), so only this many are
+# served per process. A stream only notices a gone client when a write fails, so the keep-alive
+# interval bounds how long a disconnected client keeps its slot.
+feed = EventFeed(int(os.environ.get("LIBRARY_MAX_EVENT_STREAMS", 4)),
+                 float(os.environ.get("LIBRARY_EVENT_STREAM_KEEPALIVE", 5)))
+
+def record_events(events: list) -> None:
+    """Append ``events`` (BookEvent column dicts) to the change log in the current transaction."""
+    if events:
+        db.session.execute(db.insert(BookEvent), events)
+        db.session.info["book_events"] = True
+
+@db.event.listens_for(db.session, "after_commit")
+def _notify_event_streams(session):
+    if session.info.pop("book_events", False):
+        feed.notify()
+
+@db.event.listens_for(db.session, "after_rollback")
+def _forget_events(session):
+    session.info.pop("book_events", None)
+
+def latest_event_seq() -> int:
+    """Highest seq ever assigned, counting pruned events; 0 before the first event."""
+    return db.session.execute(
+        db.text("SELECT seq FROM sqlite_sequence WHERE name = 'book_event'")
+    ).scalar() or 0
+
+def with_event_seq(view):
+    """Send ``X-Event-Seq`` with a listing: following ``/api/events`` from there misses no change to it."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        seq = latest_event_seq()
+        resp = make_response(view(*args, **kwargs))
+        resp.headers["X-Event-Seq"] = str(seq)
+        return resp
+    return wrapper
+
+def _book_event(event_type: str, book_id: int, title=None, author=None) -> dict:
+    return {"type": event_type, "book_id": book_id, "title": title, "author": author}
+
+def _loan_event(event_type: str, loan) -> dict:
+    return {"type": event_type, "book_id": loan.book_id, "loan_id": loan.id, "user_id": loan.user_id}
+
+@app.route("/api/books", methods=["POST"])
+def create_book():
+    fields, error = validate_book(request.get_json() or {})
+    if error:
+        return jsonify({"error": error}), 400
+    book = Book(**fields, title_id=_add_copies({(fields["title"], fields["author"]): (1, 1)})[fields["title"], fields["author"]])
     db.session.add(book)
+    db.session.flush()
+    record_events([_book_event("book_created", book.id, book.title, book.author)])
     db.session.commit()
     return jsonify(book.to_dict()), 201
 
+def _add_copies(counts: dict) -> dict:
+    """Add ``{(title, author): (copies, available)}`` to the titles' counters, creating missing titles.
+
+    Returns ``{(title, author): title_id}``.
+    """
+    titles = Title.__table__
+    stmt = sqlite_insert(titles).returning(titles.c.id, titles.c.title, titles.c.author)
+    stmt = stmt.on_conflict_do_update(index_elements=[titles.c.title, titles.c.author], set_={
+        "copies": titles.c.copies + stmt.excluded.copies,
+        "available_copies": titles.c.available_copies + stmt.excluded.available_copies,
+    })
+    rows = [{"title": title, "author": author, "copies": copies, "available_copies": available}
+            for (title, author), (copies, available) in counts.items()]
+    return {(title, author): title_id for title_id, title, author in db.session.connection().execute(stmt, rows)}
+
+def _remove_copy(title_id, available: bool) -> None:
+    """Take one copy off ``title_id``'s counters, deleting the title with its last copy."""
+    if title_id is None:
+        return
+    titles, connection = Title.__table__, db.session.connection()
+    connection.execute(db.update(titles).where(titles.c.id == title_id).values(
+        copies=titles.c.copies - 1, available_copies=titles.c.available_copies - int(available),
+    ))
+    connection.execute(db.delete(titles).where(titles.c.id == title_id, titles.c.copies == 0))
+
+def _insert_books(chunk: list) -> list:
+    counts = {}
+    for _, row in chunk:
+        key = (row["title"], row["author"])
+        counts[key] = counts.get(key, 0) + 1
+    title_ids = _add_copies({key: (n, n) for key, n in counts.items()})
+    rows = [dict(row, title_id=title_ids[row["title"], row["author"]]) for _, row in chunk]
+    inserted = db.session.execute(db.insert(Book).returning(Book.id, Book.title, Book.author), rows)
+    record_events([_book_event("book_created", *book) for book in inserted])
+    db.session.commit()
+    return []
+
+def import_books(stream, csv_format: bool = False) -> dict:
+    """Bulk-load books from an NDJSON or CSV byte stream."""
+    return run_import(iter_records(stream, csv_format), validate_book, _insert_books)
+
+@app.route("/api/books/import", methods=["POST"])
+def import_books_route():
+    """Bulk-load books from an NDJSON (default) or text/csv request body."""
+    return jsonify(import_books(request.stream, is_csv(request.content_type))), 200
+
+BOOK_COLUMNS = {"id": Book.id, "title": Book.title, "author": Book.author, "status": Book.status,
+                "title_id": Book.title_id}
+SEARCH_TERM_RE = re.compile(r"\w+")
+
+def book_match_expression(q: str = None, title: str = None, author: str = None) -> str:
+    """Build an FTS5 MATCH expression; every word is quoted and prefix-matched, all must match."""
+    parts = []
+    for column, text in ((None, q), ("title", title), ("author", author)):
+        for term in SEARCH_TERM_RE.findall(text or ""):
+            parts.append(f'{column} : "{term}"*' if column else f'"{term}"*')
+    return " ".join(parts)
+
 @app.route("/api/books", methods=["GET"])
+@with_event_seq
+@versions.conditional("book")
 def get_books():
-    print("GET /api/books called")
-    books = Book.query.all()
-    print("Books query done")
-    return jsonify([b.to_dict() for b in books]), 200
+    """List books with optional full-text search (q, title, author), id and status filters, sort and fields."""
+    args = request.args
+    try:
+        order_by = parse_sort(args["sort"], BOOK_COLUMNS) if args.get("sort", "id") != "id" else None
+        fields = parse_fields(args.get("fields", ""), BOOK_COLUMNS)
+        ids = parse_ids(args["ids"]) if "ids" in args else None
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    query = Book.query
+    if ids is not None:
+        query = query.filter(Book.id.in_(ids))
+    if args.get("q") or args.get("title") or args.get("author"):
+        match = book_match_expression(args.get("q"), args.get("title"), args.get("author"))
+        if not match:
+            query = query.filter(db.false())
+        else:
+            matching = db.select(db.literal_column("rowid")).select_from(db.table("book_fts")).where(
+                db.text("book_fts MATCH :match").bindparams(match=match)
+            )
+            query = query.filter(Book.id.in_(matching))
+    if args.get("status"):
+        query = query.filter_by(status=args["status"])
+    # Column tuples rather than Book objects; id is always selected for the paging cursor.
+    query, serialize = as_rows(query, [Book.id, *(BOOK_COLUMNS[f] for f in fields or BOOK_COLUMNS if f != "id")], fields)
+    if ids is not None:
+        # One batch larger than the id list, so a single IN query answers it.
+        return list_response(query, Book.id, serialize, order_by, batch_size=len(ids) + 1)
+    return list_response(query, Book.id, serialize, order_by)
+
+BOOK_ROW = (Book.id, Book.title, Book.author, Book.status, Book.title_id)
 
 @app.route("/api/books/<int:book_id>", methods=["PATCH", "PUT"])
 def update_book(book_id: int):
-    """Update a book's title and/or author."""
+    """Update a book's title and/or author.
+
+    The UPDATE returns the copy's status under the write lock, so moving the copy to
+    another title's counters cannot race a borrow or return of it.
+    """
     data = request.get_json() or {}
-    book = Book.query.get(book_id)
-    if not book:
-        return jsonify({"error": "Book not found."}), 404
     title = data.get("title")
     author = data.get("author")
+    values = {name: value.strip() for name, value in (("title", title), ("author", author))
+              if isinstance(value, str) and value.strip()}
+    if values:
+        book = db.session.execute(db.update(Book).where(Book.id == book_id).values(**values).returning(*BOOK_ROW)).first()
+    else:
+        book = db.session.query(*BOOK_ROW).filter(Book.id == book_id).first()
+    if book is None:
+        db.session.rollback()
+        return jsonify({"error": "Book not found."}), 404
     if title is None and author is None:
         return jsonify({"error": "No fields provided."}), 400
-    if isinstance(title, str) and title.strip():
-        book.title = title.strip()
-    if isinstance(author, str) and author.strip():
-        book.author = author.strip()
+    title_id = book.title_id
+    if values and db.session.query(Title.id).filter(
+        Title.id == title_id, Title.title == book.title, Title.author == book.author
+    ).first() is None:
+        # The copy now belongs to another title.
+        available = book.status == "AVAILABLE"
+        _remove_copy(title_id, available)
+        title_id = _add_copies({(book.title, book.author): (1, int(available))})[book.title, book.author]
+        db.session.execute(db.update(Book).where(Book.id == book_id).values(title_id=title_id))
+    record_events([_book_event("book_updated", book.id, book.title, book.author)])
     db.session.commit()
-    return jsonify(book.to_dict()), 200
+    return jsonify(dict(book._mapping, title_id=title_id)), 200
 
 @app.route("/api/books/<int:book_id>", methods=["DELETE"])
 def delete_book(book_id: int):
-    """Delete a book if it is not currently borrowed."""
-    book = Book.query.get(book_id)
-    if not book:
-        return jsonify({"error": "Book not found."}), 404
-    if book.status == "BORROWED":
+    """Delete a book if it is not currently borrowed.
+
+    The guarded DELETE is the status check, so a concurrent borrow either takes the
+    book first (409 here) or finds it gone.
+    """
+    deleted = db.session.execute(
+        db.delete(Book).where(Book.id == book_id, Book.status == "AVAILABLE").returning(Book.title_id)
+    ).first()
+    if deleted is None:
+        db.session.rollback()
+        if not _existing_book_ids([book_id]):
+            return jsonify({"error": "Book not found."}), 404
         return jsonify({"error": "Cannot delete a borrowed book."}), 409
-    db.session.delete(book)
+    _remove_copy(deleted.title_id, available=True)
+    db.session.execute(db.delete(Hold).where(Hold.book_id == book_id))
+    record_events([_book_event("book_deleted", book_id)])
     db.session.commit()
     return jsonify({"message": "Book deleted."}), 200
 
+def available_books_query():
+    return Book.query.filter_by(status="AVAILABLE")
+
 @app.route("/api/books/available", methods=["GET"])
+@with_event_seq
+@versions.conditional("book")
 def get_available_books():
-    books = Book.query.filter_by(status="AVAILABLE").all()
-    return jsonify([b.to_dict() for b in books]), 200
+    query, serialize = as_rows(available_books_query(), BOOK_COLUMNS.values())
+    return list_response(query, Book.id, serialize)
+
+def _batch_book_ids(data: dict):
+    """Return the integer book ids of a batch request, or None if the list is missing or malformed."""
+    book_ids = data.get("book_ids")
+    if not isinstance(book_ids, list) or not book_ids:
+        return None
+    try:
+        return [int(book_id) for book_id in book_ids]
+    except (TypeError, ValueError):
+        return None
+
+# Title counters change only together with their copies' rows, so they are updated on the
+# session's connection and leave the "book" table version to mark the change.
+COUNT_AVAILABLE = db.update(Title.__table__).where(Title.__table__.c.id == db.bindparam("title_id")).values(
+    available_copies=Title.__table__.c.available_copies + db.bindparam("delta")
+)
+
+def _count_available(title_ids, delta: int) -> None:
+    """Add ``delta`` to the available_copies of each title in ``title_ids``, once per copy."""
+    counts = Counter(title_id for title_id in title_ids if title_id is not None)
+    if counts:
+        db.session.connection().execute(
+            COUNT_AVAILABLE, [{"title_id": title_id, "delta": delta * n} for title_id, n in counts.items()]
+        )
+
+def _claim_books(claims: dict) -> dict:
+    """Flip the AVAILABLE books of ``claims``, ``{book_id: (user_id, due_date)}``, to BORROWED and open their loans.
+
+    One guarded UPDATE over the whole batch is the availability check, so of two
+    concurrent borrows of a book exactly one gets it back; one INSERT opens the loans.
+    Returns ``{book_id: loan}`` with each new loan's id, user_id, book_id, borrowed_at and due_date.
+    """
+    claimed = db.session.execute(
+        db.update(Book).where(Book.id.in_(claims), Book.status == "AVAILABLE").values(status="BORROWED")
+        .returning(Book.id, Book.title_id)
+    ).all()
+    if not claimed:
+        return {}
+    _count_available((title_id for _, title_id in claimed), -1)
+    now = datetime.utcnow()
+    loans = db.session.execute(
+        db.insert(Loan).returning(Loan.id, Loan.user_id, Loan.book_id, Loan.borrowed_at, Loan.due_date),
+        [{"user_id": claims[book_id][0], "book_id": book_id, "borrowed_at": now, "due_date": claims[book_id][1]}
+         for book_id, _ in claimed],
+    )
+    return {loan.book_id: loan for loan in loans}
+
+def _open_loans_of(book_ids):
+    """The open loans of ``book_ids``; ordered by book_id so SQLite reads them from ix_loan_open_book."""
+    return db.session.query(Loan.id, Loan.user_id, Loan.book_id, Loan.borrowed_at, Loan.due_date).filter(
+        Loan.book_id.in_(book_ids), Loan.returned_at.is_(None)
+    ).order_by(Loan.book_id)
+
+def _release_books(book_ids, now: datetime):
+    """Flip the BORROWED books among ``book_ids`` to AVAILABLE and close their open loans.
+
+    One guarded UPDATE, one IN select of the open loans and one UPDATE closing them,
+    whatever the batch size. Returns ``(loans, errors)``: ``{book_id: loan}`` with each
+    closed loan's id, user_id, book_id, borrowed_at and due_date, and ``{book_id: error}``.
+    """
+    released = dict(db.session.execute(
+        db.update(Book).where(Book.id.in_(book_ids), Book.status == "BORROWED").values(status="AVAILABLE")
+        .returning(Book.id, Book.title_id)
+    ).all())
+    if not released:
+        return {}, {}
+    loans = {loan.book_id: loan for loan in _open_loans_of(released)}
+    errors = {book_id: "No open loan for this book." for book_id in released if book_id not in loans}
+    if errors:
+        db.session.execute(db.update(Book).where(Book.id.in_(errors)).values(status="BORROWED"))
+    if loans:
+        _count_available((released[book_id] for book_id in loans), 1)
+        db.session.execute(db.update(Loan).where(Loan.id.in_([loan.id for loan in loans.values()]))
+                           .values(returned_at=now))
+    return loans, errors
+
+def _hold_queue_heads(book_ids):
+    # SQLite returns the other columns from the row holding min(position): each queue's head.
+    return db.session.query(Hold.id, Hold.book_id, Hold.user_id, Hold.days, db.func.min(Hold.position)).filter(
+        Hold.book_id.in_(book_ids)
+    ).group_by(Hold.book_id)
+
+def _fill_holds(book_ids, now: datetime) -> dict:
+    """Lend books released in the current transaction to the heads of their hold queues.
+
+    Returns ``{book_id: Loan}`` for the books someone was waiting for.
+    """
+    heads = _hold_queue_heads(book_ids).all()
+    if not heads:
+        return {}
+    db.session.execute(db.delete(Hold).where(Hold.id.in_([hold.id for hold in heads])))
+    return _claim_books({hold.book_id: (hold.user_id, now + timedelta(days=hold.days) if hold.days else None)
+                         for hold in heads})
+
+def _existing_book_ids(book_ids) -> set:
+    return {book_id for (book_id,) in db.session.query(Book.id).filter(Book.id.in_(book_ids))}
+
+@retry_on_busy(db)
+def borrow_books(user_id, book_ids: list, due_date=None) -> list:
+    """Borrow ``book_ids`` for ``user_id`` in one short transaction; return one result per id."""
+    claimed = _claim_books({book_id: (user_id, due_date) for book_id in book_ids})
+    results, loans = [], []
+    for book_id in book_ids:
+        # A book listed twice is lent once.
+        loan = claimed.pop(book_id, None)
+        if loan is None:
+            results.append({"book_id": book_id, "status": 409, "error": "Book not available."})
+        else:
+            result = {"book_id": book_id, "status": 201, "message": "Borrowed"}
+            results.append(result)
+            loans.append((result, loan))
+    failed = [r for r in results if r["status"] != 201]
+    if failed:
+        existing = _existing_book_ids([r["book_id"] for r in failed])
+        for result in failed:
+            if result["book_id"] not in existing:
+                result.update(status=404, error="Book not found.")
+    for result, loan in loans:
+        result["loan_id"] = loan.id
+    if loans:
+        record_events([_loan_event("borrowed", loan) for _, loan in loans])
+        circulation.record_borrows(db.session.connection(),
+                                   [(loan.user_id, loan.book_id, loan.borrowed_at) for _, loan in loans])
+    db.session.commit()
+    return results
+
+@retry_on_busy(db)
+def return_books(book_ids: list) -> list:
+    """Return ``book_ids`` in one short transaction; return one result per id.
+
+    A returned book with holds goes straight to the head of its queue in the same transaction.
+    """
+    now = datetime.utcnow()
+    closed, errors = _release_books(book_ids, now)
+    handed = _fill_holds(list(closed), now) if closed else {}
+    results, events, returned = [], [], []
+    for book_id in book_ids:
+        # A book listed twice is returned once.
+        loan = closed.pop(book_id, None)
+        if loan is None:
+            results.append({"book_id": book_id, "status": 409, "error": errors.pop(book_id, "Book not borrowed.")})
+        else:
+            results.append({"book_id": book_id, "status": 200, "message": "Returned", "loan_id": loan.id})
+            events.append(_loan_event("returned", loan))
+            returned.append(loan)
+    failed = [r for r in results if r["status"] != 200]
+    if failed:
+        existing = _existing_book_ids([r["book_id"] for r in failed])
+        for result in failed:
+            if result["book_id"] not in existing:
+                result.update(status=404, error="Book not found.")
+    if handed:
+        for result in results:
+            loan = handed.get(result["book_id"]) if result["status"] == 200 else None
+            if loan is not None:
+                result["handed_to"] = {"user_id": loan.user_id, "loan_id": loan.id}
+        events.extend(_loan_event("borrowed", loan) for loan in handed.values())
+        circulation.record_borrows(db.session.connection(),
+                                   [(loan.user_id, loan.book_id, loan.borrowed_at) for loan in handed.values()])
+    record_events(events)
+    circulation.record_returns(db.session.connection(), [
+        (result.user_id, result.book_id, result.borrowed_at, result.due_date, now) for result in returned
+    ])
+    db.session.commit()
+    return results
+
+def _single_book_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _single_result(result: dict):
+    status = result.pop("status")
+    result.pop("book_id")
+    return jsonify(result), status
+
+# Copies a borrow by title tries before giving up when others keep taking them first.
+TITLE_BORROW_ATTEMPTS = 5
+
+def _available_copy(title_id: int):
+    return db.session.query(Book.id).filter(Book.title_id == title_id, Book.status == "AVAILABLE").limit(1)
+
+def borrow_title(user_id, title_id: int, due_date=None) -> dict:
+    """Borrow any available copy of ``title_id``; return a ``borrow_books`` result with the copy's book_id.
+
+    The title's counter answers "none left" with one read; otherwise one indexed
+    read finds a copy on the shelf and the guarded claim takes it.
+    """
+    for _ in range(TITLE_BORROW_ATTEMPTS):
+        available = db.session.query(Title.available_copies).filter(Title.id == title_id).scalar()
+        if available is None:
+            return {"book_id": None, "status": 404, "error": "Title not found."}
+        if not available:
+            break
+        copy_id = _available_copy(title_id).scalar()
+        if copy_id is None:
+            break
+        result = borrow_books(user_id, [copy_id], due_date)[0]
+        if result["status"] == 201:
+            return dict(result, title_id=title_id)
+    return {"book_id": None, "status": 409, "error": "No copy available."}
 
 @app.route("/api/borrow", methods=["POST"])
+@limiter.limit("5/minute", scope="borrow")
 def borrow_book():
-    ip = request.remote_addr
-    now = time.time()
-    attempts = rate_limit.get(ip, [])
-    attempts = [t for t in attempts if now - t < 60]
-    if len(attempts) >= 5:
-        return jsonify({"error": "rate limit exceeded"}), 429
-    attempts.append(now)
-    rate_limit[ip] = attempts
-
+    """Borrow a book by ``book_id``, or any available copy of ``title_id``."""
     data = request.get_json()
     user_id = data.get("user_id")
     book_id = data.get("book_id")
+    title_id = data.get("title_id")
     days = data.get("days")
-    if not user_id or not book_id:
+    if not user_id or not (book_id or title_id):
         return jsonify({"error": "Missing user_id or book_id."}), 400
-    user_resp = requests.get(f"http://localhost:5001/api/users/{user_id}")
-    if user_resp.status_code == 404:
-        return jsonify({"error": "User not found."}), 404
-    book = Book.query.get(book_id)
-    if not book:
-        return jsonify({"error": "Book not found."}), 404
-    if book.status != "AVAILABLE":
-        return jsonify({"error": "Book not available."}), 409
-    open_loan = Loan.query.filter_by(book_id=book_id, returned_at=None).first()
-    if open_loan:
-        return jsonify({"error": "Book already on loan."}), 409
+    try:
+        if not users_client.user_exists(user_id):
+            return jsonify({"error": "User not found."}), 404
+    except UsersServiceUnavailable:
+        return jsonify({"error": "Users service unavailable."}), 503
     due_date = None
     if isinstance(days, int) and days > 0:
         due_date = datetime.utcnow() + timedelta(days=days)
-    loan = Loan(user_id=user_id, book_id=book_id, due_date=due_date)
-    book.status = "BORROWED"
-    db.session.add(loan)
-    db.session.commit()
-    return jsonify({"message": "Borrowed", "loan_id": loan.id}), 201
+    if not book_id:
+        title_id = _single_book_id(title_id)
+        if title_id is None:
+            return jsonify({"error": "Title not found."}), 404
+        result = borrow_title(user_id, title_id, due_date)
+        status = result.pop("status")
+        return jsonify(result), status
+    book_id = _single_book_id(book_id)
+    if book_id is None:
+        return jsonify({"error": "Book not found."}), 404
+    return _single_result(borrow_books(user_id, [book_id], due_date)[0])
 
 @app.route("/api/return", methods=["POST"])
 def return_book():
@@ -180,46 +917,530 @@ def return_book():
     book_id = data.get("book_id")
     if not book_id:
         return jsonify({"error": "Missing book_id."}), 400
-    book = Book.query.get(book_id)
-    if not book:
+    book_id = _single_book_id(book_id)
+    if book_id is None:
         return jsonify({"error": "Book not found."}), 404
-    if book.status != "BORROWED":
-        return jsonify({"error": "Book not borrowed."}), 409
-    open_loan = Loan.query.filter_by(book_id=book_id, returned_at=None).first()
-    if not open_loan:
-        return jsonify({"error": "No open loan for this book."}), 409
-    open_loan.returned_at = datetime.utcnow()
-    book.status = "AVAILABLE"
+    return _single_result(return_books([book_id])[0])
+
+TITLE_COLUMNS = (Title.id, Title.title, Title.author, Title.copies, Title.available_copies)
+
+@app.route("/api/titles", methods=["GET"])
+@with_event_seq
+@versions.conditional("book")
+def get_titles():
+    """List titles with their copy counters (filter: available=true; ids)."""
+    query = Title.query
+    try:
+        ids = parse_ids(request.args["ids"]) if "ids" in request.args else None
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if ids is not None:
+        query = query.filter(Title.id.in_(ids))
+    if request.args.get("available", "").lower() == "true":
+        query = query.filter(Title.available_copies > 0)
+    query, serialize = as_rows(query, TITLE_COLUMNS)
+    return list_response(query, Title.id, serialize, batch_size=len(ids) + 1 if ids is not None else BATCH_SIZE)
+
+def available_titles_query():
+    return Title.query.filter(Title.available_copies > 0)
+
+@app.route("/api/titles/available", methods=["GET"])
+@with_event_seq
+@versions.conditional("book")
+def get_available_titles():
+    """Titles with at least one copy on the shelf: one row per title, read from ix_title_available."""
+    query, serialize = as_rows(available_titles_query(), TITLE_COLUMNS)
+    return list_response(query, Title.id, serialize)
+
+@app.route("/api/titles/<int:title_id>", methods=["GET"])
+def get_title(title_id: int):
+    """A title's counters and the ids of its copies."""
+    title = db.session.get(Title, title_id)
+    if title is None:
+        return jsonify({"error": "Title not found."}), 404
+    copies = db.session.query(Book.id, Book.status).filter(Book.title_id == title_id).order_by(Book.id)
+    return jsonify(dict(title.to_dict(), books=[{"id": book_id, "status": status} for book_id, status in copies])), 200
+
+@app.route("/api/borrow/batch", methods=["POST"])
+@limiter.limit("5/minute", scope="borrow")
+def borrow_books_batch():
+    """Borrow several books for one user: one user check, one transaction."""
+    data = request.get_json() or {}
+    user_id = data.get("user_id")
+    book_ids = _batch_book_ids(data)
+    days = data.get("days")
+    if not user_id or book_ids is None:
+        return jsonify({"error": "Missing user_id or book_ids."}), 400
+    if len(book_ids) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} books per batch."}), 400
+    try:
+        if not users_client.user_exists(user_id):
+            return jsonify({"error": "User not found."}), 404
+    except UsersServiceUnavailable:
+        return jsonify({"error": "Users service unavailable."}), 503
+    due_date = None
+    if isinstance(days, int) and days > 0:
+        due_date = datetime.utcnow() + timedelta(days=days)
+    return jsonify({"results": borrow_books(user_id, book_ids, due_date)}), 200
+
+@app.route("/api/return/batch", methods=["POST"])
+def return_books_batch():
+    """Return several books in one transaction."""
+    data = request.get_json() or {}
+    book_ids = _batch_book_ids(data)
+    if book_ids is None:
+        return jsonify({"error": "Missing book_ids."}), 400
+    if len(book_ids) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} books per batch."}), 400
+    return jsonify({"results": return_books(book_ids)}), 200
+
+# A book back on the shelf before its hold is queued is borrowed instead; tries before giving up.
+HOLD_ATTEMPTS = 3
+
+def queue_position(book_id: int, position: int) -> int:
+    """1-based place in ``book_id``'s queue of the hold at ``position``; counted on ix_hold_book_position."""
+    return db.session.execute(_holds_ahead(book_id, position)).scalar()
+
+def _holds_ahead(book_id: int, position: int):
+    return db.select(db.func.count()).where(Hold.book_id == book_id, Hold.position <= position)
+
+def _own_open_loan(user_id: int, book_id: int):
+    # likely() keeps SQLite on ix_loan_open_book (one row) rather than the patron's whole loan history.
+    return db.select(Loan.id).where(
+        Loan.book_id == book_id, Loan.returned_at.is_(None), db.func.likely(Loan.user_id == user_id)
+    )
+
+@retry_on_busy(db)
+def _enqueue_hold(user_id: int, book_id: int, days):
+    """Append a hold to ``book_id``'s queue in one statement, but only while someone else has the book out.
+
+    The duplicate and own-loan checks run inside the write, so two concurrent requests
+    from one patron cannot both queue. Returns a result dict, or None if the book is not out.
+    """
+    own_loan = _own_open_loan(user_id, book_id)
+    next_position = db.select(db.func.coalesce(db.func.max(Hold.position), 0) + 1).where(
+        Hold.book_id == book_id
+    ).scalar_subquery()
+    stmt = db.insert(Hold).from_select(
+        ["book_id", "user_id", "position", "days", "placed_at"],
+        db.select(Book.id, db.literal(user_id), next_position, db.literal(days, db.Integer),
+                  db.literal(datetime.utcnow(), db.DateTime))
+        .where(Book.id == book_id, Book.status == "BORROWED", ~own_loan.exists()),
+    ).returning(Hold.id, Hold.position)
+    try:
+        hold = db.session.execute(stmt).first()
+    except IntegrityError:
+        db.session.rollback()
+        return {"book_id": book_id, "status": 409, "error": "Already on hold."}
+    if hold is None:
+        # The INSERT took the write lock, so this read agrees with the guard it just failed.
+        borrowed = db.session.execute(own_loan).first() is not None
+        db.session.rollback()
+        return {"book_id": book_id, "status": 409, "error": "Book already borrowed by this user."} if borrowed else None
+    result = {"book_id": book_id, "status": 201, "message": "On hold", "hold_id": hold.id,
+              "queue_position": queue_position(book_id, hold.position)}
+    db.session.commit()
+    return result
+
+def hold_book(user_id: int, book_id: int, days=None) -> dict:
+    """Join ``book_id``'s hold queue, or borrow it at once if it is on the shelf; return one result.
+
+    Holds are only queued while the book is out, and a return lends the book to the
+    head of its queue in the same transaction, so no hold waits on a book on the shelf.
+    """
+    due_date = datetime.utcnow() + timedelta(days=days) if days else None
+    for _ in range(HOLD_ATTEMPTS):
+        result = _enqueue_hold(user_id, book_id, days)
+        if result is not None:
+            return result
+        result = borrow_books(user_id, [book_id], due_date)[0]
+        if result["status"] != 409:
+            return result
+    return {"book_id": book_id, "status": 409, "error": "Book not available."}
+
+@app.route("/api/holds", methods=["POST"])
+@limiter.limit("5/minute", scope="hold")
+def place_hold():
+    """Queue for a borrowed book instead of polling /api/borrow; borrows it if it is on the shelf."""
+    data = request.get_json() or {}
+    user_id = data.get("user_id")
+    book_id = data.get("book_id")
+    days = data.get("days")
+    if not user_id or not book_id:
+        return jsonify({"error": "Missing user_id or book_id."}), 400
+    try:
+        if not users_client.user_exists(user_id):
+            return jsonify({"error": "User not found."}), 404
+    except UsersServiceUnavailable:
+        return jsonify({"error": "Users service unavailable."}), 503
+    book_id = _single_book_id(book_id)
+    book = db.session.query(Book.title_id).filter(Book.id == book_id).first() if book_id is not None else None
+    if book is None:
+        return jsonify({"error": "Book not found."}), 404
+    days = days if isinstance(days, int) and days > 0 else None
+    # Answered like /api/borrow: the title, not the copy's book_id.
+    return _single_result(dict(hold_book(int(user_id), book_id, days), title_id=book.title_id))
+
+def holds_query(book_id=None, user_id=None):
+    query = Hold.query
+    if book_id:
+        query = query.filter_by(book_id=book_id)
+    if user_id:
+        query = query.filter_by(user_id=user_id)
+    return query
+
+@app.route("/api/holds", methods=["GET"])
+@versions.conditional("hold")
+def get_holds():
+    """List holds (filters: book_id, user_id); a book's holds come in queue order."""
+    query = holds_query(request.args.get("book_id", type=int), request.args.get("user_id", type=int))
+    query, serialize = as_rows(query, HOLD_COLUMNS)
+    return list_response(query, Hold.id, serialize)
+
+@app.route("/api/holds/<int:hold_id>", methods=["GET"])
+def get_hold(hold_id: int):
+    """A hold and its place in the queue; 1 means the book goes to this patron on its next return."""
+    hold = db.session.get(Hold, hold_id)
+    if hold is None:
+        return jsonify({"error": "Hold not found."}), 404
+    return jsonify(dict(hold.to_dict(), queue_position=queue_position(hold.book_id, hold.position))), 200
+
+@app.route("/api/holds/<int:hold_id>", methods=["DELETE"])
+def cancel_hold(hold_id: int):
+    """Leave the queue; the holds behind move up without being renumbered."""
+    if not db.session.execute(db.delete(Hold).where(Hold.id == hold_id)).rowcount:
+        return jsonify({"error": "Hold not found."}), 404
     db.session.commit()
-    return jsonify({"message": "Returned", "loan_id": open_loan.id}), 200
+    return jsonify({"message": "Hold cancelled."}), 200
+
+def loans_query(user_id=None, open_filter=""):
+    """Loans in the hot table, optionally one patron's and only open (``"true"``) or returned (``"false"``) ones."""
+    query = Loan.query
+    if user_id:
+        query = query.filter_by(user_id=user_id)
+    if open_filter == "true":
+        # Through likely() the term only matches the partial ix_loan_open_id, which returns open loans in id order.
+        query = query.filter(db.func.likely(Loan.returned_at.is_(None)))
+    elif open_filter == "false":
+        query = query.filter(Loan.returned_at.isnot(None))
+    return query
+
+def archived_loans_query(user_id=None):
+    query = LoanArchive.query
+    return query.filter_by(user_id=user_id) if user_id else query
 
 @app.route("/api/loans", methods=["GET"])
+@with_event_seq
+@versions.conditional("loan", "loan_archive")
 def get_loans():
-    print("GET /api/loans called")
+    """List open and recently returned loans; ``history=full`` adds archived loans, still in id order."""
     user_id = request.args.get("user_id", type=int)
-    open_filter = request.args.get("open")
-    query = Loan.query
+    open_filter = (request.args.get("open") or "").lower()
+    history = request.args.get("history", "recent")
+    if history not in ("recent", "full"):
+        return jsonify({"error": "history must be 'recent' or 'full'."}), 400
+    query, serialize = as_rows(loans_query(user_id, open_filter), LOAN_COLUMNS)
+    if history == "full" and open_filter != "true":
+        # Archived loans keep their ids, so the union pages by id like the hot table alone.
+        query = query.union_all(archived_loans_query(user_id).with_entities(*ARCHIVE_COLUMNS))
+    return list_response(query, Loan.id, serialize)
+
+# Returned loans older than LOAN_ARCHIVE_DAYS move to loan_archive, so the loan table
+# that borrow, return and the default listings read holds only open and recent loans.
+ARCHIVE_AFTER_DAYS = int(os.environ.get("LOAN_ARCHIVE_DAYS", 90))
+# Seconds between background archive passes; 0 turns the background thread off.
+ARCHIVE_INTERVAL = float(os.environ.get("LOAN_ARCHIVE_INTERVAL", 3600))
+# Days of change log kept for consumers catching up; the archive pass prunes older events.
+EVENT_RETENTION_DAYS = int(os.environ.get("EVENT_RETENTION_DAYS", 7))
+ARCHIVE_BATCH_SIZE = 1000
+
+def _loans_to_archive(cutoff, batch_size: int):
+    # The newest loan always stays, so SQLite never hands out an archived id to a new loan.
+    newest = db.session.query(db.func.max(Loan.id)).scalar_subquery()
+    return db.session.query(Loan.id).filter(Loan.returned_at < cutoff, Loan.id < newest).order_by(
+        Loan.returned_at
+    ).limit(batch_size)
+
+@retry_on_busy(db)
+def _archive_batch(cutoff, batch_size: int) -> int:
+    """Move up to ``batch_size`` loans returned before ``cutoff`` to loan_archive in one transaction."""
+    ids = [loan_id for (loan_id,) in _loans_to_archive(cutoff, batch_size)]
+    if not ids:
+        return 0
+    # Rows another pass moved since the SELECT above drop out of both statements.
+    db.session.execute(db.insert(LoanArchive).from_select(
+        [column.key for column in ARCHIVE_COLUMNS],
+        db.select(*LOAN_COLUMNS).where(Loan.id.in_(ids)),
+    ))
+    moved = db.session.execute(
+        db.delete(Loan).where(Loan.id.in_(ids)).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return moved
+
+@retry_on_busy(db)
+def _prune_event_batch(cutoff, batch_size: int) -> int:
+    """Delete up to ``batch_size`` of the oldest events recorded before ``cutoff`` in one transaction."""
+    oldest = db.select(BookEvent.seq).where(BookEvent.at < cutoff).order_by(BookEvent.seq).limit(batch_size)
+    pruned = db.session.execute(
+        db.delete(BookEvent).where(BookEvent.seq.in_(oldest)).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return pruned
+
+def _in_batches(run_batch, cutoff, batch_size: int, stop) -> int:
+    total = 0
+    while stop is None or not stop.is_set():
+        count = run_batch(cutoff, batch_size)
+        total += count
+        if not count:
+            break
+    return total
+
+def archive_returned_loans(cutoff, batch_size: int = ARCHIVE_BATCH_SIZE, stop=None) -> int:
+    """Archive every loan returned before ``cutoff``, one short transaction per batch; return how many moved.
+
+    ``stop`` is an optional ``threading.Event`` checked between batches.
+    """
+    return _in_batches(_archive_batch, cutoff, batch_size, stop)
+
+def prune_events(cutoff, batch_size: int = ARCHIVE_BATCH_SIZE, stop=None) -> int:
+    """Delete change log events recorded before ``cutoff``, in batches; return how many were deleted."""
+    return _in_batches(_prune_event_batch, cutoff, batch_size, stop)
+
+class LoanArchiver:
+    """Background thread archiving old loans and pruning old events every ``interval`` seconds."""
+
+    def __init__(self, interval: float = ARCHIVE_INTERVAL, max_age_days: int = ARCHIVE_AFTER_DAYS):
+        self.interval = interval
+        self.max_age_days = max_age_days
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="loan-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop after the batch in progress, if any."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                with app.app_context():
+                    now = datetime.utcnow()
+                    moved = archive_returned_loans(now - timedelta(days=self.max_age_days), stop=self._stop)
+                    pruned = prune_events(now - timedelta(days=EVENT_RETENTION_DAYS), stop=self._stop)
+                if moved or pruned:
+                    app.logger.info("Archived %d returned loans, pruned %d events.", moved, pruned)
+            except Exception:
+                app.logger.exception("Loan archive pass failed.")
+            if self._stop.wait(self.interval):
+                return
+
+archiver = LoanArchiver()
+
+MAX_DUE_SOON_HOURS = 24 * 90
+
+def parse_as_of(arg):
+    """Parse an ISO-8601 ``as_of`` argument to naive UTC; a missing one means now. Raises ValueError."""
+    if not arg:
+        return datetime.utcnow()
+    value = datetime.fromisoformat(arg)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def open_loans_due(before, since=None, user_id=None):
+    """Open loans due in ``[since, before)``, which the due-date indexes return in due-date order without a scan."""
+    is_open = Loan.returned_at.is_(None)
     if user_id:
-        query = query.filter_by(user_id=user_id)
-    if open_filter is not None:
-        if open_filter.lower() == "true":
-            query = query.filter_by(returned_at=None)
-        elif open_filter.lower() == "false":
-            query = query.filter(Loan.returned_at.isnot(None))
-    print("About to query DB for loans")
-    loans = query.all()
-    print("Loans query done")
-    return jsonify([l.to_dict() for l in loans]), 200
+        # likely() keeps the term from driving ix_loan_returned_due, which SQLite otherwise rates
+        # the same as ix_loan_open_user_due; the partial index still matches, so it always wins.
+        is_open = db.func.likely(is_open)
+    query = Loan.query.filter(is_open, Loan.due_date.isnot(None), Loan.due_date < before)
+    if since is not None:
+        query = query.filter(Loan.due_date >= since)
+    if user_id:
+        query = query.filter(Loan.user_id == user_id)
+    return query
 
 @app.route("/api/overdue", methods=["GET"])
 def get_overdue():
-    now = datetime.utcnow()
-    overdue_loans = Loan.query.filter(
-        Loan.returned_at.is_(None),
-        Loan.due_date.isnot(None),
-        Loan.due_date < now
-    ).all()
-    return jsonify([l.to_dict() for l in overdue_loans]), 200
+    try:
+        as_of = parse_as_of(request.args.get("as_of"))
+    except ValueError:
+        return jsonify({"error": "as_of must be an ISO-8601 date or datetime."}), 400
+    query = open_loans_due(as_of, user_id=request.args.get("user_id", type=int))
+    query, serialize = as_rows(query, LOAN_COLUMNS)
+    return list_response(query, Loan.id, serialize, keyset_by=Loan.due_date)
+
+@app.route("/api/overdue/upcoming", methods=["GET"])
+def get_due_soon():
+    try:
+        as_of = parse_as_of(request.args.get("as_of"))
+    except ValueError:
+        return jsonify({"error": "as_of must be an ISO-8601 date or datetime."}), 400
+    hours = request.args.get("hours", 24, type=int)
+    if not 1 <= hours <= MAX_DUE_SOON_HOURS:
+        return jsonify({"error": f"hours must be between 1 and {MAX_DUE_SOON_HOURS}."}), 400
+    query = open_loans_due(as_of + timedelta(hours=hours), since=as_of, user_id=request.args.get("user_id", type=int))
+    query, serialize = as_rows(query, LOAN_COLUMNS)
+    return list_response(query, Loan.id, serialize, keyset_by=Loan.due_date)
+
+MAX_STATS_DAYS = 366
+MAX_TOP_BOOKS = 100
+
+def parse_day_range(args):
+    """Return ``(start, end)`` dates from ``from``/``to`` (ISO dates, default the last 30 days). Raises ValueError."""
+    end = date.fromisoformat(args["to"]) if args.get("to") else datetime.utcnow().date()
+    start = date.fromisoformat(args["from"]) if args.get("from") else end - timedelta(days=29)
+    if start > end:
+        raise ValueError("from must not be after to.")
+    return start, end
+
+@app.route("/api/stats/daily", methods=["GET"])
+def get_daily_stats():
+    """Borrows, returns, late returns and average loan length per day, from the daily rollup."""
+    try:
+        start, end = parse_day_range(request.args)
+    except ValueError:
+        return jsonify({"error": "from and to must be ISO-8601 dates, from not after to."}), 400
+    if (end - start).days >= MAX_STATS_DAYS:
+        return jsonify({"error": f"At most {MAX_STATS_DAYS} days per request."}), 400
+    return jsonify(circulation.daily(start, end)), 200
+
+@app.route("/api/stats/summary", methods=["GET"])
+def get_stats_summary():
+    """Totals over a date range, from the daily rollup."""
+    try:
+        start, end = parse_day_range(request.args)
+    except ValueError:
+        return jsonify({"error": "from and to must be ISO-8601 dates, from not after to."}), 400
+    return jsonify(circulation.summary(start, end)), 200
+
+@app.route("/api/stats/books/top", methods=["GET"])
+def get_top_books():
+    """Most borrowed books of all time, from the per-book rollup."""
+    limit = max(1, min(request.args.get("limit", 10, type=int), MAX_TOP_BOOKS))
+    top = circulation.top_books(limit)
+    titles = dict(db.session.query(Book.id, Book.title).filter(Book.id.in_([row[0] for row in top])))
+    return jsonify([
+        {"book_id": book_id, "title": titles.get(book_id), "borrows": borrows, "returns": returns,
+         "average_loan_days": average}
+        for book_id, borrows, returns, average in top
+    ]), 200
+
+@app.route("/api/stats/users/<int:user_id>", methods=["GET"])
+def get_user_stats(user_id: int):
+    """A patron's borrows, late returns and loans overdue now; overdue_rate is their share of all borrows."""
+    stats = circulation.user(user_id) or {"user_id": user_id, "borrows": 0, "returns": 0, "late_returns": 0}
+    # Overdue now: a range read of the patron's open loans by due date.
+    stats["overdue_now"] = open_loans_due(datetime.utcnow(), user_id=user_id).count()
+    borrows = stats["borrows"]
+    stats["overdue_rate"] = round((stats["late_returns"] + stats["overdue_now"]) / borrows, 4) if borrows else None
+    return jsonify(stats), 200
+
+# Server-sent event streams: reconnect delay advised to clients and maximum lifetime
+# (clients resume from Last-Event-ID after it).
+STREAM_RETRY_MS = 2000
+STREAM_MAX_SECONDS = 300
+
+def _resync_needed(since: int, latest: int) -> bool:
+    """Whether events after ``since`` were pruned (or ``since`` is ahead of this log)."""
+    if since > latest:
+        return True
+    first = db.session.query(db.func.min(BookEvent.seq)).scalar()
+    return since < (first if first is not None else latest + 1) - 1
+
+def events_after(since: int, limit: int = MAX_PAGE_SIZE) -> list:
+    query, serialize = as_rows(_events_query(since, limit), EVENT_COLUMNS)
+    return [serialize(row) for row in query]
+
+def _events_query(since: int, limit: int = MAX_PAGE_SIZE):
+    return BookEvent.query.filter(BookEvent.seq > since).order_by(BookEvent.seq).limit(limit)
+
+RESYNC_ERROR = "Events after since were pruned; reload the collections and follow from their X-Event-Seq."
+
+@app.route("/api/events", methods=["GET"])
+def get_events():
+    """Changes after ``since``, oldest first; ``X-Event-Seq`` is the ``since`` for the next call."""
+    since = request.args.get("since", 0, type=int)
+    limit = max(1, min(request.args.get("limit", MAX_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    latest = latest_event_seq()
+    if _resync_needed(since, latest):
+        return jsonify({"error": RESYNC_ERROR, "latest_seq": latest}), 410
+    events = events_after(since, limit)
+    resp = jsonify(events)
+    resp.headers["X-Event-Seq"] = str(events[-1]["seq"] if events else since)
+    return resp, 200
+
+def _sse(event: dict) -> str:
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {app.json.dumps(event)}\n\n"
+
+def event_stream_start(since):
+    """Where a stream resuming after ``since`` (None: now) starts, and the reset event to send instead, if any."""
+    latest = latest_event_seq()
+    if since is None:
+        return latest, None
+    if _resync_needed(since, latest):
+        return since, _sse({"seq": since, "type": "reset", "error": RESYNC_ERROR})
+    return since, None
+
+def event_stream_batch(since: int) -> tuple:
+    """The SSE text of the events after ``since``, the seq to continue after, and whether more are waiting."""
+    events = events_after(since)
+    # Do not hold a pooled connection while waiting.
+    db.session.close()
+    if not events:
+        return "", since, False
+    return "".join(map(_sse, events)), events[-1]["seq"], len(events) == MAX_PAGE_SIZE
+
+def _event_stream(since, release_slot):
+    """Yield the stream's SSE text; frees its stream slot as soon as it ends or the server closes it."""
+    try:
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        since, reset = event_stream_start(since)
+        if reset:
+            yield reset
+            return
+        started = last_sent = time.monotonic()
+        while time.monotonic() - started < STREAM_MAX_SECONDS:
+            text, since, more = event_stream_batch(since)
+            if text:
+                yield text
+                last_sent = time.monotonic()
+                if more:
+                    continue
+            elif time.monotonic() - last_sent >= feed.keepalive:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            feed.wait()
+    finally:
+        release_slot()
+
+@app.route("/api/events/stream", methods=["GET"])
+def stream_events():
+    """Server-sent events for every change; resumes after ``Last-Event-ID`` (or ``since``), else starts at now."""
+    since = request.headers.get("Last-Event-ID", type=int)
+    if since is None:
+        since = request.args.get("since", type=int)
+    release_slot = feed.open_stream()
+    if release_slot is None:
+        return jsonify({"error": "Too many event streams."}), 503, {"Retry-After": "5"}
+    resp = Response(stream_with_context(_event_stream(since, release_slot)), mimetype="text/event-stream")
+    # The generator's finally does not run if the response is closed before it starts.
+    resp.call_on_close(release_slot)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
 @app.route("/docs")
 def docs():
@@ -231,12 +1452,30 @@ def docs():
         <table border="1" cellpadding="6">
             <tr><th>Method</th><th>Path</th><th>Notes</th></tr>
             <tr><td>POST</td><td>/api/books</td><td>Create book (title, author)</td></tr>
-            <tr><td>GET</td><td>/api/books</td><td>List all books</td></tr>
-            <tr><td>GET</td><td>/api/books/available</td><td>List available books</td></tr>
-            <tr><td>POST</td><td>/api/borrow</td><td>Borrow a book (optional "days" param sets due_date)</td></tr>
+            <tr><td>GET</td><td>/api/books</td><td>List all books (paging: after_id, limit; format=ndjson streams; search: q, title, author; filters: status, ids=1,2,3 (up to 1000); sort=title,-author with offset paging; fields=id,title)</td></tr>
+            <tr><td>POST</td><td>/api/books/import</td><td>Bulk-load books from an NDJSON or text/csv body (title, author); per-line errors reported</td></tr>
+            <tr><td>GET</td><td>/api/books/available</td><td>List available copies, one row per copy (paging: after_id, limit); /api/titles/available lists one row per title</td></tr>
+            <tr><td>POST</td><td>/api/borrow</td><td>Borrow a book by book_id, or any available copy of a title by title_id (optional "days" param sets due_date)</td></tr>
             <tr><td>POST</td><td>/api/return</td><td>Return a book</td></tr>
-            <tr><td>GET</td><td>/api/loans</td><td>List loans (filters: user_id, open)</td></tr>
-            <tr><td>GET</td><td>/api/overdue</td><td>List overdue loans</td></tr>
+            <tr><td>POST</td><td>/api/borrow/batch</td><td>Borrow up to 100 books for one user (user_id, book_ids, optional days); per-book status in "results"</td></tr>
+            <tr><td>POST</td><td>/api/return/batch</td><td>Return up to 100 books (book_ids); per-book status in "results"</td></tr>
+            <tr><td>POST</td><td>/api/holds</td><td>Queue for a borrowed book (user_id, book_id, optional days for the loan); borrows it at once if it is on the shelf. Answers with title_id and hold_id/queue_position, or loan_id if borrowed</td></tr>
+            <tr><td>GET</td><td>/api/holds</td><td>List holds (filters: book_id gives the queue in order, user_id; paging: after_id, limit)</td></tr>
+            <tr><td>GET</td><td>/api/holds/&lt;id&gt;</td><td>A hold with its queue_position (1 = next); 404 once filled or cancelled</td></tr>
+            <tr><td>DELETE</td><td>/api/holds/&lt;id&gt;</td><td>Cancel a hold</td></tr>
+            <tr><td>GET</td><td>/api/titles</td><td>List titles with copies and available_copies (filters: available=true, ids; paging: after_id, limit)</td></tr>
+            <tr><td>GET</td><td>/api/titles/available</td><td>List titles with a copy on the shelf, one row per title (paging: after_id, limit)</td></tr>
+            <tr><td>GET</td><td>/api/titles/&lt;id&gt;</td><td>A title's counters and its copies</td></tr>
+            <tr><td>GET</td><td>/api/loans</td><td>List open and recently returned loans (filters: user_id, open; history=full adds archived loans; paging: after_id, limit)</td></tr>
+            <tr><td>GET</td><td>/api/overdue</td><td>List overdue loans, most overdue first (filters: user_id, as_of; paging: after_id, limit)</td></tr>
+            <tr><td>GET</td><td>/api/overdue/upcoming</td><td>List open loans due within the next N hours (hours, default 24; filters: user_id, as_of; paging: after_id, limit)</td></tr>
+            <tr><td>GET</td><td>/api/stats/daily</td><td>Borrows, returns, late returns and average loan days per day (from, to: ISO dates, default the last 30 days, at most 366)</td></tr>
+            <tr><td>GET</td><td>/api/stats/summary</td><td>The same totals over a date range, with the late-return rate</td></tr>
+            <tr><td>GET</td><td>/api/stats/books/top</td><td>Most borrowed books (limit, default 10, max 100)</td></tr>
+            <tr><td>GET</td><td>/api/stats/users/&lt;id&gt;</td><td>A patron's borrows, returns, late returns, loans overdue now and overdue rate</td></tr>
+            <tr><td>GET</td><td>/api/events</td><td>Book and loan changes after a sequence number, oldest first (since, limit up to 1000; next since in X-Event-Seq; 410 if they were pruned)</td></tr>
+            <tr><td>GET</td><td>/api/events/stream</td><td>The same changes as server-sent events, resuming after Last-Event-ID or since</td></tr>
+            <tr><td>GET</td><td>/metrics</td><td>Request latency, status counts, SQL statements per request and Users API call latency (Prometheus text format)</td></tr>
         </table>
         <hr>
         <h2>Examples</h2>
@@ -244,24 +1483,48 @@ def docs():
         </code></pre></details>
     <details><summary>Borrow with due date</summary><pre><code>curl -X POST http://localhost:5050/api/borrow -H "Content-Type: application/json" -d '{"user_id": 1, "book_id": 1, "days": 3}'
         </code></pre></details>
+    <details><summary>Batch borrow</summary><pre><code>curl -X POST http://localhost:5050/api/borrow/batch -H "Content-Type: application/json" -d '{"user_id": 1, "book_ids": [1, 2, 3], "days": 14}'
+        </code></pre></details>
+    <details><summary>Hold an unavailable book</summary><pre><code>curl -X POST http://localhost:5050/api/holds -H "Content-Type: application/json" -d '{"user_id": 2, "book_id": 1, "days": 14}'
+curl http://localhost:5050/api/holds/1   # queue_position
+        </code></pre></details>
+    <details><summary>Follow changes</summary><pre><code>curl -i "http://localhost:5050/api/books/available?limit=100"   # note X-Event-Seq
+curl "http://localhost:5050/api/events?since=42"
+curl -N -H "Last-Event-ID: 42" http://localhost:5050/api/events/stream
+        </code></pre></details>
     <details><summary>Overdue loans</summary><pre><code>curl http://localhost:5050/api/overdue
         </code></pre></details>
+    <details><summary>Page through loans</summary><pre><code>curl -i "http://localhost:5050/api/loans?limit=100"
+curl -i "http://localhost:5050/api/loans?after_id=100&amp;limit=100"   # next cursor is in X-Next-After-Id
+        </code></pre></details>
+    <details><summary>Search the catalog</summary><pre><code>curl "http://localhost:5050/api/books?q=tolkien%20ring&amp;sort=title&amp;fields=id,title&amp;limit=20"
+curl "http://localhost:5050/api/books?title=dune&amp;status=AVAILABLE"
+        </code></pre></details>
+    <details><summary>Stream all books as NDJSON</summary><pre><code>curl "http://localhost:5050/api/books?format=ndjson"
+        </code></pre></details>
         <details><summary>Rate limit example</summary><pre><code>429 {"error": "rate limit exceeded"}
         </code></pre></details>
         <hr>
         <h2>Rules & Notes</h2>
         <table border="1" cellpadding="6">
             <tr><th>Rule</th></tr>
-            <tr><td>Must validate user via Users API before borrowing</td></tr>
-            <tr><td>Conflicts return 409</td></tr>
+            <tr><td>Must validate user via Users API before borrowing (answers cached; 503 if the Users API is down)</td></tr>
+            <tr><td>Conflicts return 409; concurrent borrows of one book: exactly one succeeds</td></tr>
             <tr><td>Borrow accepts optional "days" param for due_date</td></tr>
-            <tr><td>More than 5 borrow attempts per minute per IP returns 429</td></tr>
+            <tr><td>More than 5 borrow attempts per minute per IP returns 429 with Retry-After (a batch counts as one attempt; override with RATE_LIMITS="borrow=20/minute")</td></tr>
             <tr><td>/api/overdue returns open loans past due_date</td></tr>
+            <tr><td>Instead of retrying a 409 from /api/borrow, place a hold: returning a book lends it to the first hold in its queue in the same transaction ("handed_to" in the return result); hold requests have their own limit of 5 per minute per IP (RATE_LIMITS="hold=...")</td></tr>
+            <tr><td>Loans returned more than LOAN_ARCHIVE_DAYS (90) days ago move to loan_archive in hourly background passes (LOAN_ARCHIVE_INTERVAL seconds; 0 disables) or with "flask --app books_service archive-loans"</td></tr>
+            <tr><td>/api/books, /api/books/available and /api/loans send ETag/Last-Modified and answer 304 to If-None-Match/If-Modified-Since when unchanged</td></tr>
+            <tr><td>Each book row is one copy of a title (same title and author); a title's available_copies changes in the same transaction as the copy's status</td></tr>
+            <tr><td>Statistics come from rollups updated with every borrow and return; "flask --app books_service backfill-stats" rebuilds them from the loan history</td></tr>
+            <tr><td>Every book create/update/delete, borrow and return is appended to the change log in the same transaction; listings send X-Event-Seq to follow it from; events are kept EVENT_RETENTION_DAYS (7) days</td></tr>
         </table>
         '''
         return html, 200
 
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
-    app.run(port=5050)
\ No newline at end of file
+        migrate_schema()
+    archiver.start()
+    app.run(port=int(os.environ.get("BOOKS_PORT", 5050)))
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""
+Streaming bulk import shared by the Books and Users services.
+
+Bodies are NDJSON (one JSON object per line) or CSV with a header row. They are
+parsed line by line from the request stream, validated with the same rules as
+the single-row endpoints, and inserted with executemany in chunked transactions.
+Rows that fail validation or insertion are reported by line number; the rest of
+the load carries on.
+"""
+
+import codecs
+import csv
+import json
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+def is_csv(content_type: str = None, filename: str = None) -> bool:
+    if filename:
+        return filename.lower().endswith(".csv")
+    return bool(content_type) and content_type.split(";")[0].strip().lower() in ("text/csv", "application/csv")
+
+
+def _decode_lines(stream, bad_lines: list):
+    """Yield the lines of a binary stream as text, dropping a leading BOM.
+
+    A line that is not valid UTF-8 is yielded as a blank line and its number is
+    appended to ``bad_lines``, so one bad byte does not end the import.
+    """
+    for line_no, raw in enumerate(stream, start=1):
+        if line_no == 1 and raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            yield raw.decode("utf-8")
+        except UnicodeDecodeError:
+            bad_lines.append(line_no)
+            yield "\n"
+
+
+def iter_records(stream, csv_format: bool = False):
+    """Yield ``(line, record, error)`` for each row of a binary stream; ``record`` is None on parse errors."""
+    bad_lines = []
+    lines = _decode_lines(stream, bad_lines)
+    if csv_format:
+        reader = csv.DictReader(lines)
+        for record in reader:
+            while bad_lines:
+                yield bad_lines.pop(0), None, "Invalid UTF-8."
+            yield reader.line_num, record, None
+        for line_no in bad_lines:
+            yield line_no, None, "Invalid UTF-8."
+        return
+    for line_no, line in enumerate(lines, start=1):
+        if bad_lines:
+            bad_lines.clear()
+            yield line_no, None, "Invalid UTF-8."
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, None, "Invalid JSON."
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "Expected a JSON object."
+            continue
+        yield line_no, record, None
+
+
+def run_import(records, validate, insert_chunk, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Validate ``records`` and hand valid rows to ``insert_chunk`` ``chunk_size`` at a time.
+
+    ``validate(record)`` returns ``(row, error)``. ``insert_chunk(rows)`` receives a list of
+    ``(line, row)`` pairs, inserts and commits them, and returns ``(line, error)`` pairs for
+    any rows it had to reject.
+    """
+    report = {"inserted": 0, "failed": 0, "errors": []}
+
+    def fail(line, error):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line, "error": error})
+
+    def flush(chunk):
+        rejected = insert_chunk(chunk)
+        for line, error in rejected:
+            fail(line, error)
+        report["inserted"] += len(chunk) - len(rejected)
+
+    chunk = []
+    for line, record, error in records:
+        if record is not None:
+            row, error = validate(record)
+        if error:
+            fail(line, error)
+            continue
+        chunk.append((line, row))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    return report
@@ -0,0 +1,105 @@
+"""
+Per-table change versions and conditional GET support for the Books and Users services.
+
+Every insert, update or delete of a mapped table bumps that table's row in
+``table_version`` inside the same transaction, whether it goes through the unit
+of work (``session.add``/``delete``/attribute changes) or an ORM-enabled
+``insert``/``update``/``delete`` statement. List endpoints decorated with
+``@versions.conditional("book")`` answer with a weak ETag and Last-Modified built
+from those versions and reply 304 Not Modified, without running the collection
+query, when the client already has the current representation.
+"""
+
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import make_response, request
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+class ChangeVersions:
+    """Tracks a version counter and last-modified time per table of ``db``."""
+
+    def __init__(self, db):
+        self.db = db
+        self.table = db.Table(
+            "table_version",
+            db.Column("name", db.String(64), primary_key=True),
+            db.Column("version", db.Integer, nullable=False),
+            db.Column("updated_at", db.DateTime, nullable=False),
+        )
+        event.listen(db.session, "before_flush", self._before_flush)
+        event.listen(db.session, "do_orm_execute", self._do_orm_execute)
+        event.listen(db.session, "after_transaction_end", self._after_transaction_end)
+
+    def bump(self, connection, *names: str) -> None:
+        """Increment the versions of ``names`` on ``connection``'s transaction."""
+        now = datetime.utcnow()
+        for name in names:
+            stmt = sqlite_insert(self.table).values(name=name, version=1, updated_at=now)
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=["name"],
+                set_={"version": self.table.c.version + 1, "updated_at": now},
+            ))
+
+    def _bump_once(self, session, names) -> None:
+        # One bump per table per transaction is enough to change the ETag.
+        bumped = session.info.setdefault("bumped_tables", set())
+        pending = sorted(set(names) - bumped)
+        if pending:
+            self.bump(session.connection(), *pending)
+            bumped.update(pending)
+
+    def _before_flush(self, session, flush_context, instances) -> None:
+        self._bump_once(session, {
+            obj.__table__.name
+            for objs in (session.new, session.dirty, session.deleted)
+            for obj in objs
+            if hasattr(obj, "__table__")
+        })
+
+    def _do_orm_execute(self, state) -> None:
+        if state.is_insert or state.is_update or state.is_delete:
+            table = getattr(state.statement, "table", None)
+            if table is not None and table is not self.table:
+                self._bump_once(state.session, {table.name})
+
+    def _after_transaction_end(self, session, transaction) -> None:
+        if transaction.parent is None:
+            session.info.pop("bumped_tables", None)
+
+    def current(self, *names: str):
+        """Return ``(etag, last_modified)`` for the given tables."""
+        rows = dict(
+            (name, (version, updated_at))
+            for name, version, updated_at in self.db.session.execute(
+                self.db.select(self.table).where(self.table.c.name.in_(names))
+            )
+        )
+        etag = "-".join(f"{name}{rows.get(name, (0, None))[0]}" for name in names)
+        stamps = [updated_at for _, updated_at in rows.values()]
+        last_modified = max(stamps).replace(tzinfo=timezone.utc) if stamps else None
+        return etag, last_modified
+
+    def conditional(self, *names: str):
+        """Decorate a GET view whose body depends only on ``names`` and the request arguments."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                etag, last_modified = self.current(*names)
+                if request.if_none_match:
+                    not_modified = request.if_none_match.contains_weak(etag)
+                else:
+                    # Last-Modified has one-second resolution, so only a strictly older change is safe to skip.
+                    since = request.if_modified_since
+                    not_modified = bool(since and last_modified and last_modified.replace(microsecond=0) < since)
+                resp = make_response("", 304) if not_modified else make_response(view(*args, **kwargs))
+                if resp.status_code in (200, 304):
+                    resp.set_etag(etag, weak=True)
+                    resp.headers["Cache-Control"] = "no-cache"
+                    if last_modified:
+                        resp.last_modified = last_modified
+                return resp
+            return wrapper
+        return decorator
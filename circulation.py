@@ -0,0 +1,168 @@
+"""
+Circulation rollups for the Books Service.
+
+Borrows and returns update per-day, per-book and per-user counters in the same
+transaction, so reports read a handful of rollup rows instead of the loan
+history. ``backfill`` rebuilds every rollup from the loan tables with one
+aggregate query per rollup, for existing databases or after a repair.
+
+Days are UTC dates; a loan's duration counts on the day it is returned, and a
+return is late when it comes after the loan's due date.
+"""
+
+from collections import defaultdict
+from functools import lru_cache
+
+from sqlalchemy import case, func, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+SECONDS_PER_DAY = 86400
+
+
+@lru_cache(maxsize=None)
+def _upsert_statement(table, key: str, columns: tuple):
+    stmt = sqlite_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={name: table.c[name] + stmt.excluded[name] for name in columns if name != key},
+    )
+
+
+def _upsert(connection, table, key: str, rows: list) -> None:
+    """Add each row's counters to the existing row with the same ``key``, inserting missing rows."""
+    if rows:
+        connection.execute(_upsert_statement(table, key, tuple(rows[0])), rows)
+
+
+def _average_days(seconds, returns):
+    return round(seconds / returns / SECONDS_PER_DAY, 2) if returns else None
+
+
+class Circulation:
+    """Circulation counters kept in rollup tables of ``db``."""
+
+    def __init__(self, db):
+        self.db = db
+        self.days = db.Table(
+            "circulation_day",
+            db.Column("day", db.Date, primary_key=True),
+            db.Column("borrows", db.Integer, nullable=False, default=0),
+            db.Column("returns", db.Integer, nullable=False, default=0),
+            db.Column("late_returns", db.Integer, nullable=False, default=0),
+            db.Column("loan_seconds", db.Float, nullable=False, default=0.0),
+        )
+        self.books = db.Table(
+            "circulation_book",
+            db.Column("book_id", db.Integer, primary_key=True),
+            db.Column("borrows", db.Integer, nullable=False, default=0),
+            db.Column("returns", db.Integer, nullable=False, default=0),
+            db.Column("loan_seconds", db.Float, nullable=False, default=0.0),
+            # Most-borrowed books straight from the index.
+            db.Index("ix_circulation_book_borrows", "borrows", "book_id"),
+        )
+        self.users = db.Table(
+            "circulation_user",
+            db.Column("user_id", db.Integer, primary_key=True),
+            db.Column("borrows", db.Integer, nullable=False, default=0),
+            db.Column("returns", db.Integer, nullable=False, default=0),
+            db.Column("late_returns", db.Integer, nullable=False, default=0),
+        )
+
+    def record_borrows(self, connection, loans) -> None:
+        """Count ``loans``, ``(user_id, book_id, borrowed_at)`` tuples, on ``connection``'s transaction."""
+        days, books, users = defaultdict(int), defaultdict(int), defaultdict(int)
+        for user_id, book_id, borrowed_at in loans:
+            days[borrowed_at.date()] += 1
+            books[int(book_id)] += 1
+            users[int(user_id)] += 1
+        _upsert(connection, self.days, "day", [{"day": k, "borrows": n} for k, n in days.items()])
+        _upsert(connection, self.books, "book_id", [{"book_id": k, "borrows": n} for k, n in books.items()])
+        _upsert(connection, self.users, "user_id", [{"user_id": k, "borrows": n} for k, n in users.items()])
+
+    def record_returns(self, connection, loans) -> None:
+        """Count returned ``loans``, ``(user_id, book_id, borrowed_at, due_date, returned_at)`` tuples."""
+        days = defaultdict(lambda: {"returns": 0, "late_returns": 0, "loan_seconds": 0.0})
+        books = defaultdict(lambda: {"returns": 0, "loan_seconds": 0.0})
+        users = defaultdict(lambda: {"returns": 0, "late_returns": 0})
+        for user_id, book_id, borrowed_at, due_date, returned_at in loans:
+            seconds = (returned_at - borrowed_at).total_seconds()
+            late = int(due_date is not None and returned_at > due_date)
+            for row in (days[returned_at.date()], books[int(book_id)], users[int(user_id)]):
+                row["returns"] += 1
+                if "late_returns" in row:
+                    row["late_returns"] += late
+                if "loan_seconds" in row:
+                    row["loan_seconds"] += seconds
+        _upsert(connection, self.days, "day", [{"day": k, **v} for k, v in days.items()])
+        _upsert(connection, self.books, "book_id", [{"book_id": k, **v} for k, v in books.items()])
+        _upsert(connection, self.users, "user_id", [{"user_id": k, **v} for k, v in users.items()])
+
+    def backfill(self, connection, loan_tables) -> None:
+        """Replace all rollups with totals aggregated from ``loan_tables`` (tables with the loan columns)."""
+        loans = union_all(*(
+            select(t.c.user_id, t.c.book_id, t.c.borrowed_at, t.c.due_date, t.c.returned_at) for t in loan_tables
+        )).subquery("loans")
+        returned = loans.c.returned_at.isnot(None)
+        late = case((returned & loans.c.due_date.isnot(None) & (loans.c.returned_at > loans.c.due_date), 1), else_=0)
+        seconds = case(
+            (returned, (func.julianday(loans.c.returned_at) - func.julianday(loans.c.borrowed_at)) * SECONDS_PER_DAY),
+            else_=0.0,
+        )
+        # Borrows count on the borrow day and returns on the return day, so days come from two halves.
+        by_day = union_all(
+            select(func.date(loans.c.borrowed_at).label("day"), literal(1).label("borrows"),
+                   literal(0).label("returns"), literal(0).label("late_returns"), literal(0.0).label("loan_seconds")),
+            select(func.date(loans.c.returned_at), literal(0), literal(1), late, seconds).where(returned),
+        ).subquery("by_day")
+        for table in (self.days, self.books, self.users):
+            connection.execute(table.delete())
+        connection.execute(self.days.insert().from_select(
+            ["day", "borrows", "returns", "late_returns", "loan_seconds"],
+            select(by_day.c.day, func.sum(by_day.c.borrows), func.sum(by_day.c.returns),
+                   func.sum(by_day.c.late_returns), func.sum(by_day.c.loan_seconds)).group_by(by_day.c.day),
+        ))
+        returns = func.sum(case((returned, 1), else_=0))
+        connection.execute(self.books.insert().from_select(
+            ["book_id", "borrows", "returns", "loan_seconds"],
+            select(loans.c.book_id, func.count(), returns, func.sum(seconds)).group_by(loans.c.book_id),
+        ))
+        connection.execute(self.users.insert().from_select(
+            ["user_id", "borrows", "returns", "late_returns"],
+            select(loans.c.user_id, func.count(), returns, func.sum(late)).group_by(loans.c.user_id),
+        ))
+
+    def daily(self, start, end) -> list:
+        """Counters for each day in ``[start, end]`` that had any borrow or return."""
+        rows = self.db.session.execute(
+            select(self.days).where(self.days.c.day.between(start, end)).order_by(self.days.c.day)
+        )
+        return [{"day": row.day.isoformat(), "borrows": row.borrows, "returns": row.returns,
+                 "late_returns": row.late_returns, "average_loan_days": _average_days(row.loan_seconds, row.returns)}
+                for row in rows]
+
+    def summary(self, start, end) -> dict:
+        """Totals over ``[start, end]``; reads one rollup row per day."""
+        d = self.days.c
+        borrows, returns, late, seconds = self.db.session.execute(
+            select(func.coalesce(func.sum(d.borrows), 0), func.coalesce(func.sum(d.returns), 0),
+                   func.coalesce(func.sum(d.late_returns), 0), func.coalesce(func.sum(d.loan_seconds), 0.0))
+            .where(d.day.between(start, end))
+        ).one()
+        return {"from": start.isoformat(), "to": end.isoformat(), "borrows": borrows, "returns": returns,
+                "late_returns": late, "late_return_rate": round(late / returns, 4) if returns else None,
+                "average_loan_days": _average_days(seconds, returns)}
+
+    def top_books_query(self, limit: int):
+        """The statement behind ``top_books``, read in order from ix_circulation_book_borrows."""
+        b = self.books.c
+        return select(self.books).order_by(b.borrows.desc(), b.book_id.desc()).limit(limit)
+
+    def top_books(self, limit: int) -> list:
+        """``(book_id, borrows, returns, average_loan_days)`` of the ``limit`` most borrowed books."""
+        rows = self.db.session.execute(self.top_books_query(limit))
+        return [(row.book_id, row.borrows, row.returns, _average_days(row.loan_seconds, row.returns)) for row in rows]
+
+    def user(self, user_id: int):
+        """The user's counters as a dict, or None if they never borrowed."""
+        row = self.db.session.execute(select(self.users).where(self.users.c.user_id == user_id)).first()
+        return dict(row._mapping) if row is not None else None
@@ -0,0 +1,177 @@
+"""
+Request, SQL and outbound HTTP instrumentation shared by the three services.
+
+``Metrics.init_app`` times every request and records, per route, a latency
+histogram, a request counter by status and the number and total time of SQL
+statements it ran (from SQLAlchemy cursor events). ``instrument_session`` wraps
+a ``requests`` session so calls to other services are timed too. Everything is served in the Prometheus text format at ``/metrics`` and
+summarized per response in a ``Server-Timing`` header.
+
+Metrics are kept per process. The timings of streamed responses cover the time
+to the first byte only.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """Thread-safe registry of counters and histograms for one service."""
+
+    def __init__(self):
+        self.tracks_sql = False
+        self._lock = threading.Lock()
+        # name -> (kind, help, label names, buckets, {label values: value or [bucket counts, sum, count]})
+        self._metrics = {}
+        self.counter("http_requests_total", "HTTP requests handled, by route and status.", ("method", "route", "status"))
+        self.histogram("http_request_duration_seconds", "Time to handle a request.", ("method", "route"))
+        self.histogram("db_queries_per_request", "SQL statements executed per request.", ("route",), COUNT_BUCKETS)
+        self.histogram("db_time_per_request_seconds", "Time spent in SQL statements per request.", ("route",))
+        self.counter("db_queries_total", "SQL statements executed.", ())
+        self.histogram("http_client_request_duration_seconds", "Outbound HTTP call latency, by target service.",
+                       ("target", "method", "status"))
+
+    def counter(self, name: str, help_text: str, labels: tuple) -> None:
+        self._metrics[name] = ("counter", help_text, labels, None, {})
+
+    def histogram(self, name: str, help_text: str, labels: tuple, buckets: tuple = LATENCY_BUCKETS) -> None:
+        self._metrics[name] = ("histogram", help_text, labels, buckets, {})
+
+    def inc(self, name: str, *labels, amount: float = 1) -> None:
+        series = self._metrics[name][4]
+        with self._lock:
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name: str, value: float, *labels) -> None:
+        _, _, _, buckets, series = self._metrics[name]
+        with self._lock:
+            entry = series.get(labels)
+            if entry is None:
+                entry = series[labels] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, label_names, buckets, series) in self._metrics.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series.items()):
+                    if kind == "counter":
+                        lines.append(f"{name}{_format_labels(label_names, labels)} {value:g}")
+                        continue
+                    counts, total, count = value
+                    for bound, bucket_count in zip(buckets, counts):
+                        le = 'le="%g"' % bound
+                        lines.append(f"{name}_bucket{_format_labels(label_names, labels, le)} {bucket_count}")
+                    lines.append(f"{name}_bucket{_format_labels(label_names, labels, INF_LABEL)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(label_names, labels)} {total:.6f}")
+                    lines.append(f"{name}_count{_format_labels(label_names, labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def init_app(self, app, db=None) -> None:
+        """Time ``app``'s requests, count ``db``'s statements and serve ``/metrics``."""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule("/metrics", "metrics", lambda: Response(self.render(), mimetype="text/plain; version=0.0.4"))
+        if db is not None:
+            self.tracks_sql = True
+            with app.app_context():
+                event.listen(db.engine, "before_cursor_execute", self._before_cursor_execute)
+                event.listen(db.engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_request(self) -> None:
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql = [0, 0.0]
+        g.metrics_timings = {}
+
+    def _after_request(self, response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        queries, sql_time = g.metrics_sql
+        self.inc("http_requests_total", request.method, route, str(response.status_code))
+        self.observe("http_request_duration_seconds", elapsed, request.method, route)
+        if self.tracks_sql:
+            self.observe("db_queries_per_request", queries, route)
+            self.observe("db_time_per_request_seconds", sql_time, route)
+        timing = [f"app;dur={elapsed * 1000:.1f}"]
+        if self.tracks_sql:
+            timing.append(f'db;dur={sql_time * 1000:.1f};desc="{queries} queries"')
+        timing += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in g.metrics_timings.items()]
+        response.headers["Server-Timing"] = ", ".join(timing)
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        # Kept on the statement's own context, so one that fails leaves nothing behind on the connection.
+        context.metrics_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - context.metrics_query_start
+        self.inc("db_queries_total")
+        if has_request_context() and "metrics_sql" in g:
+            g.metrics_sql[0] += 1
+            g.metrics_sql[1] += elapsed
+
+    def _add_timing(self, name: str, seconds: float) -> None:
+        if has_request_context() and "metrics_timings" in g:
+            g.metrics_timings[name] = g.metrics_timings.get(name, 0.0) + seconds
+
+    @contextmanager
+    def span(self, name: str):
+        """Add the time spent in the block to the request's ``Server-Timing`` entry ``name``."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_timing(name, time.perf_counter() - started)
+
+    def instrument_session(self, session, targets: dict) -> None:
+        """Time every call made through ``session``; ``targets`` maps base URLs to service names.
+
+        Calls that raise (timeouts, refused connections) are recorded with status ``error``.
+        """
+        send = session.send
+
+        def timed_send(prepared, **kwargs):
+            target = next((name for base, name in targets.items() if prepared.url.startswith(base)),
+                          urlsplit(prepared.url).netloc)
+            status = "error"
+            started = time.perf_counter()
+            try:
+                resp = send(prepared, **kwargs)
+                status = str(resp.status_code)
+                return resp
+            finally:
+                seconds = time.perf_counter() - started
+                self.observe("http_client_request_duration_seconds", seconds, target, prepared.method, status)
+                self._add_timing(target, seconds)
+
+        session.send = timed_send
@@ -0,0 +1,150 @@
+"""
+Keyset pagination and streaming helpers shared by the Books and Users services.
+
+List endpoints accept ``?after_id=<id>&limit=<n>`` and return one page ordered by
+id, with the cursor for the next page in the ``X-Next-After-Id`` header. Without
+``limit`` the whole collection is streamed, either as a chunked JSON array or as
+NDJSON (``?format=ndjson``), pulling rows from the database in fixed-size batches
+so memory stays flat regardless of table size.
+
+Listings sorted on something other than id page with ``?offset=`` instead, and
+return the next offset in ``X-Next-Offset``. Listings whose natural order is an
+indexed column (such as a due date) keep keyset paging over ``(column, id)``:
+``after_id`` still names the last row seen and its column value is looked up.
+"""
+
+from itertools import islice
+
+from flask import Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import tuple_
+
+BATCH_SIZE = 500
+MAX_PAGE_SIZE = 1000
+
+
+def keyset_page(query, id_column, after_id=None, limit=BATCH_SIZE):
+    """The query for one page of ``query`` in ascending id order, after ``after_id``."""
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+    return query.order_by(id_column).limit(limit)
+
+
+def keyset_page_by(query, sort_column, id_column, after=None, limit=BATCH_SIZE):
+    """The query for one page of ``query`` ordered by ``(sort_column, id)``, after the ``(value, id)`` pair ``after``."""
+    if after is not None:
+        query = query.filter(tuple_(sort_column, id_column) > after)
+    return query.order_by(sort_column, id_column).limit(limit)
+
+
+def iter_keyset(query, id_column, after_id=None, batch_size=BATCH_SIZE):
+    """Yield rows of ``query`` in ascending id order, fetching ``batch_size`` at a time."""
+    last_id = after_id
+    while True:
+        batch = keyset_page(query, id_column, last_id, batch_size).all()
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        last_id = getattr(batch[-1], id_column.key)
+
+
+def iter_keyset_by(query, sort_column, id_column, after=None, batch_size=BATCH_SIZE):
+    """Yield rows of ``query`` ordered by ``(sort_column, id)``, starting after the ``(value, id)`` pair ``after``."""
+    while True:
+        batch = keyset_page_by(query, sort_column, id_column, after, batch_size).all()
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        after = (getattr(batch[-1], sort_column.key), getattr(batch[-1], id_column.key))
+
+
+def _json_array(rows, serialize):
+    dumps = current_app.json.dumps
+    yield "["
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + dumps(serialize(row))
+    yield "]\n"
+
+
+def _ndjson(rows, serialize):
+    dumps = current_app.json.dumps
+    for row in rows:
+        yield dumps(serialize(row)) + "\n"
+
+
+def parse_sort(arg: str, columns: dict) -> list:
+    """Turn ``"title,-author"`` into ORDER BY clauses over ``columns``; raise ValueError on unknown fields."""
+    clauses = []
+    for field in filter(None, (part.strip() for part in arg.split(","))):
+        descending = field.startswith("-")
+        column = columns.get(field.lstrip("-"))
+        if column is None:
+            raise ValueError(f"Unknown sort field: {field.lstrip('-')}.")
+        clauses.append(column.desc() if descending else column.asc())
+    return clauses
+
+
+def parse_fields(arg: str, columns: dict) -> list:
+    """Turn ``"id,title"`` into a list of field names; raise ValueError on unknown fields."""
+    fields = [part.strip() for part in arg.split(",") if part.strip()]
+    unknown = [field for field in fields if field not in columns]
+    if unknown:
+        raise ValueError(f"Unknown field: {unknown[0]}.")
+    return fields
+
+
+def parse_ids(arg: str, limit: int = MAX_PAGE_SIZE) -> list:
+    """Turn ``"3,1,2"`` into a list of distinct integer ids; raise ValueError if malformed or over ``limit``."""
+    try:
+        ids = {int(part) for part in arg.split(",") if part.strip()}
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of integers.") from None
+    if len(ids) > limit:
+        raise ValueError(f"At most {limit} ids per request.")
+    return sorted(ids)
+
+
+def list_response(query, id_column, serialize, order_by=None, keyset_by=None, batch_size=BATCH_SIZE):
+    """Answer a list request for ``query`` according to the pagination/stream arguments.
+
+    Without ``order_by`` rows are keyset-paged by id, or by ``(keyset_by, id)``
+    when given; with ``order_by`` they are sorted by it (id breaks ties) and
+    paged by offset. Streams fetch ``batch_size`` rows per query.
+    """
+    limit = request.args.get("limit", type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = None
+    if order_by:
+        offset = max(0, request.args.get("offset", 0, type=int))
+        sorted_query = query.order_by(*order_by, id_column).offset(offset)
+        rows = sorted_query.limit(limit).all() if limit is not None else sorted_query.yield_per(batch_size)
+    elif keyset_by is not None:
+        after_id = request.args.get("after_id", type=int)
+        after = None
+        if after_id is not None:
+            key = query.session.query(keyset_by).filter(id_column == after_id).scalar()
+            if key is None:
+                return jsonify({"error": "Unknown after_id."}), 400
+            after = (key, after_id)
+        rows = iter_keyset_by(query, keyset_by, id_column, after, min(limit or batch_size, batch_size))
+        if limit is not None:
+            rows = islice(rows, limit)
+    else:
+        after_id = request.args.get("after_id", type=int)
+        rows = iter_keyset(query, id_column, after_id, min(limit or batch_size, batch_size))
+        if limit is not None:
+            rows = islice(rows, limit)
+
+    if request.args.get("format") == "ndjson":
+        return Response(stream_with_context(_ndjson(rows, serialize)), mimetype="application/x-ndjson"), 200
+    if limit is None:
+        return Response(stream_with_context(_json_array(rows, serialize)), mimetype="application/json"), 200
+
+    page = list(rows)
+    resp = jsonify([serialize(row) for row in page])
+    if len(page) == limit:
+        if offset is not None:
+            resp.headers["X-Next-Offset"] = str(offset + limit)
+        else:
+            resp.headers["X-Next-After-Id"] = str(getattr(page[-1], id_column.key))
+    return resp, 200
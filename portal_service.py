@@ -1,50 +1,268 @@
-from flask import Flask, request, redirect, url_for, render_template_string
+from flask import Flask, request, redirect, url_for, render_template, stream_template, jsonify
+from itertools import islice
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+import json
+import os
 import requests
+import threading
+import time
+
+from instrumentation import Metrics
 
 app = Flask(__name__)
-USERS_API = "http://localhost:5001"
-BOOKS_API = "http://localhost:5050"
-
-FOOTER = '<hr><p><small>No JS/CSS. Server-rendered HTML only. Data via Users(5001) & Books(5050).</small></p>'
-
-NAV = (
-    '<nav>'
-    '<a href="/">Home</a> | '
-    '<a href="/users">Users</a> | '
-    '<a href="/books">Books</a> | '
-    '<a href="/borrow">Borrow</a> | '
-    '<a href="/return">Return</a> | '
-    '<a href="/loans">Loans</a> | '
-    '<a href="/admin">Admin</a> | '
-    '<a href="/about">About</a>'
-    '</nav><hr>'
-)
+metrics = Metrics()
+metrics.init_app(app)
+USERS_API = os.environ.get("USERS_API_URL", "http://localhost:5001")
+BOOKS_API = os.environ.get("BOOKS_API_URL", "http://localhost:5050")
+
+# Seconds a page may spend waiting on its backend calls, which run concurrently.
+PAGE_DEADLINE = 3.0
+
+# Keep-alive connections to both backends, shared by request threads and the fan-out pool.
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=32))
+metrics.instrument_session(session, {USERS_API: "users", BOOKS_API: "books"})
+backend_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="portal-backend")
+
+
+class BackendCache:
+    """LRU cache of backend GET responses.
+
+    Entries are served without a backend call for their URL prefix's TTL; once
+    stale they are revalidated with If-None-Match, so an unchanged collection
+    costs a 304 instead of a full download. Writes made through the portal
+    invalidate the affected prefix.
+    """
+
+    def __init__(self, ttls: dict, max_entries: int = 256):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.revalidated = 0
+
+    def ttl_for(self, url: str):
+        for prefix, ttl in self.ttls.items():
+            if url.startswith(prefix):
+                return ttl
+        return None
+
+    def get_json(self, url: str, params: dict = None, timeout: float = PAGE_DEADLINE):
+        ttl = self.ttl_for(url)
+        if ttl is None:
+            return _fetch_json(url, params, timeout)
+        key = (url, tuple(sorted((params or {}).items())))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                data, etag, expires_at = entry
+                if expires_at > time.monotonic():
+                    self.hits += 1
+                    return data
+        headers = {"If-None-Match": entry[1]} if entry is not None and entry[1] else None
+        resp = session.get(url, params=params, headers=headers, timeout=timeout)
+        if resp.status_code == 304 and entry is not None:
+            data, etag = entry[0], entry[1]
+            with self._lock:
+                self.revalidated += 1
+        else:
+            data = resp.json() if resp.status_code == 200 else []
+            etag = resp.headers.get("ETag")
+            with self._lock:
+                self.misses += 1
+            if resp.status_code != 200:
+                return data
+        with self._lock:
+            self._entries[key] = (data, etag, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+    def invalidate(self, *prefixes: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0].startswith(prefixes)]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated,
+                    "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+# Catalog reads (copies and titles) are fresh for 30s; loans are always revalidated (TTL 0) so they stay current.
+# Overdue lists only change as due dates pass or books come back, so 30s is close enough.
+cache = BackendCache({
+    f"{BOOKS_API}/api/books": 30.0,
+    f"{BOOKS_API}/api/titles": 30.0,
+    f"{USERS_API}/api/users": 30.0,
+    f"{BOOKS_API}/api/loans": 0.0,
+    f"{BOOKS_API}/api/overdue": 30.0,
+})
+
+# Every change to a copy can change its title's counters, so both listings are invalidated together.
+CATALOG = (f"{BOOKS_API}/api/books", f"{BOOKS_API}/api/titles")
+
+
+def _fetch_json(url: str, params: dict = None, timeout: float = PAGE_DEADLINE):
+    resp = session.get(url, params=params, timeout=timeout)
+    return resp.json() if resp.status_code == 200 else []
+
+
+def _get_json(url: str, params: dict = None, timeout: float = PAGE_DEADLINE):
+    return cache.get_json(url, params, timeout)
+
+
+def time_left(deadline: float) -> float:
+    """Seconds until the ``time.monotonic()`` instant ``deadline``, never negative."""
+    return max(0.0, deadline - time.monotonic())
+
+
+def fetch_all(calls: dict, deadline: float = PAGE_DEADLINE) -> dict:
+    """Run independent backend GETs concurrently, ``{name: (url, params)}`` -> ``{name: data}``.
+
+    A call that fails or is still running when the deadline passes maps to None.
+    """
+    futures = {name: backend_pool.submit(_get_json, url, params, deadline) for name, (url, params) in calls.items()}
+    with metrics.span("backends"):
+        done, _ = wait(futures.values(), timeout=deadline)
+    return {
+        name: future.result() if future in done and future.exception() is None else None
+        for name, future in futures.items()
+    }
+
+# Ids per batch lookup; the backends accept up to 1000.
+LOOKUP_BATCH = 1000
+
+
+def lookup_names(rows: list, timeout: float = PAGE_DEADLINE) -> tuple:
+    """Map the user and book ids in loan ``rows`` to names and titles with one batch call per service.
+
+    Returns ``({user_id: name}, {book_id: title})``; ids that could not be resolved are absent.
+    """
+    user_ids = sorted({row["user_id"] for row in rows})
+    book_ids = sorted({row["book_id"] for row in rows})
+    calls = {}
+    for start in range(0, len(user_ids), LOOKUP_BATCH):
+        ids = ",".join(map(str, user_ids[start:start + LOOKUP_BATCH]))
+        calls[f"users{start}"] = (f"{USERS_API}/api/users", {"ids": ids})
+    for start in range(0, len(book_ids), LOOKUP_BATCH):
+        ids = ",".join(map(str, book_ids[start:start + LOOKUP_BATCH]))
+        calls[f"books{start}"] = (f"{BOOKS_API}/api/books", {"ids": ids, "fields": "id,title"})
+    users, books = {}, {}
+    for name, data in fetch_all(calls, timeout).items():
+        target, key = (users, "name") if name.startswith("users") else (books, "title")
+        target.update((item["id"], item[key]) for item in data or [])
+    return users, books
+
+# Rows per page. Pages up to MAX_CACHED_PAGE come through the backend cache as one
+# JSON document; longer ones are streamed from the backend as NDJSON while rendering.
+PAGE_SIZE = 100
+MAX_CACHED_PAGE = 1000
+MAX_PAGE = 50000
+
+
+class BackendRows:
+    """Rows of a backend list endpoint, read lazily from its NDJSON stream.
+
+    ``error`` is set if the stream could not be read to the end.
+    """
+
+    def __init__(self, url: str, params: dict, limit: int, error: str):
+        self.url = url
+        self.params = params
+        self.limit = limit
+        self.failure_message = error
+        self.error = None
+
+    def __iter__(self):
+        try:
+            with session.get(self.url, params={**self.params, "format": "ndjson"}, stream=True, timeout=PAGE_DEADLINE) as resp:
+                if resp.status_code != 200:
+                    self.error = self.failure_message
+                    return
+                for line in islice(filter(None, resp.iter_lines()), self.limit):
+                    yield json.loads(line)
+        except requests.RequestException:
+            self.error = self.failure_message
+
+
+def page_args() -> tuple:
+    """Return ``(limit, params)`` for the page requested by ``?limit=`` and ``?after_id=``."""
+    limit = max(1, min(request.args.get("limit", PAGE_SIZE, type=int), MAX_PAGE))
+    params = {}
+    after_id = request.args.get("after_id", type=int)
+    if after_id is not None:
+        params["after_id"] = after_id
+    return limit, params
+
+
+def fetch_page(url: str, params: dict, limit: int, error: str, extra: dict = None, timeout: float = PAGE_DEADLINE) -> tuple:
+    """Fetch one page of ``url`` together with the ``extra`` calls, waiting at most ``timeout`` seconds.
+
+    Returns ``(rows, results, error)``; ``rows`` is a list for cached pages and
+    a lazy ``BackendRows`` for long ones.
+    """
+    calls = dict(extra or {})
+    if limit <= MAX_CACHED_PAGE:
+        calls["page"] = (url, {**params, "limit": limit})
+    results = fetch_all(calls, timeout) if calls else {}
+    if limit > MAX_CACHED_PAGE:
+        return BackendRows(url, params, limit, error), results, None
+    rows = results.pop("page")
+    return (rows, results, None) if rows is not None else ([], results, error)
+
+
+def page_url(after_id) -> str:
+    """URL of the current page's view starting after ``after_id`` (the first page for None)."""
+    args = request.args.to_dict()
+    args.pop("after_id", None)
+    if after_id is not None:
+        args["after_id"] = after_id
+    return url_for(request.endpoint, **args)
+
+
+def named(rows: list, user_names: dict, book_titles: dict) -> list:
+    return [dict(row, user=user_names.get(row["user_id"], row["user_id"]),
+                 book=book_titles.get(row["book_id"], row["book_id"])) for row in rows]
+
+
+def named_in_batches(rows):
+    """Add names and titles to a long stream of loans, one batch lookup per service every LOOKUP_BATCH rows."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, LOOKUP_BATCH))
+        if not chunk:
+            return
+        yield from named(chunk, *lookup_names(chunk))
+
+
+class _Named:
+    """Wraps a lazily named row stream, keeping the underlying ``error``."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return named_in_batches(self.rows)
+
+    @property
+    def error(self):
+        return getattr(self.rows, "error", None)
+
+
+app.jinja_env.globals.update(page_url=page_url, max_page=MAX_PAGE)
 
 @app.route("/")
 def home():
-    html = f'''
-    <h1>Library Borrowing System — Portal</h1>
-    <p>Consolidates Users & Books microservices.</p>
-    {NAV}
-    <table border="1" cellpadding="6">
-      <tr><th>Service</th><th>Base URL</th><th>Main Endpoints</th></tr>
-      <tr><td>Users</td><td>{USERS_API}</td><td>/api/users, /api/health</td></tr>
-      <tr><td>Books</td><td>{BOOKS_API}</td><td>/api/books, /api/borrow, /api/return, /api/loans, /api/overdue</td></tr>
-    </table>
-    {FOOTER}
-    '''
-    return render_template_string(html)
+    return render_template("home.html", users_api=USERS_API, books_api=BOOKS_API)
 
 @app.route("/about")
 def about():
-    html = f'''
-    <h1>About the Portal</h1>
-    {NAV}
-    <p>This Portal has no database. It integrates Users and Books microservices via API-only calls.</p>
-    <p>Each backend uses its own SQLite DB. The Portal only renders HTML from API data.</p>
-    {FOOTER}
-    '''
-    return render_template_string(html)
+    return render_template("about.html")
 
 @app.route("/users", methods=["GET", "POST"])
 def users():
@@ -53,7 +271,8 @@ def users():
         name = request.form.get("name", "").strip()
         email = request.form.get("email", "").strip()
         try:
-            resp = requests.post(f"{USERS_API}/api/users", json={"name": name, "email": email}, timeout=3)
+            resp = session.post(f"{USERS_API}/api/users", json={"name": name, "email": email}, timeout=3)
+            cache.invalidate(f"{USERS_API}/api/users")
             if resp.status_code == 201:
                 return redirect(url_for("users"))
             else:
@@ -61,33 +280,9 @@ def users():
                 return redirect(url_for("users", error=err))
         except Exception:
             return redirect(url_for("users", error="Error contacting Users Service"))
-    try:
-        resp = requests.get(f"{USERS_API}/api/users", timeout=3)
-        users_list = resp.json() if resp.status_code == 200 else []
-    except Exception:
-        users_list = []
-        error = error or "Error contacting Users Service"
-    table = '<table border="1" cellpadding="6"><tr><th>ID</th><th>Name</th><th>Email</th></tr>'
-    for u in users_list:
-        table += f'<tr><td>{u["id"]}</td><td>{u["name"]}</td><td>{u["email"]}</td></tr>'
-    table += '</table>'
-    form = (
-        '<fieldset><legend>Create User</legend>'
-        '<form method="post" action="/users">'
-        '  Name: <input name="name" required> '
-        'Email: <input name="email" type="email" required pattern="^[^@\\s]+@[^@\\s]+\\.[A-Za-z]{3}$"'
-        ' title="Format: name@domain.tld (3-letter TLD e.g. com, org, net)"> '
-        '<button type="submit">Create</button>'
-        '</form>'
-        '<p><small>Email must match name@domain.tld where tld is exactly 3 letters (e.g. user@example.com).</small></p>'
-        '</fieldset>'
-    )
-    html = f'''<h1>Users</h1>{NAV}
-    {table}
-    {'<p><strong>Error:</strong> ' + error + '</p>' if error else ''}
-    {form}
-    {FOOTER}'''
-    return render_template_string(html)
+    limit, params = page_args()
+    rows, _, fetch_error = fetch_page(f"{USERS_API}/api/users", params, limit, "Error contacting Users Service")
+    return stream_template("users.html", rows=rows, limit=limit, error=error or fetch_error)
 
 @app.route("/books", methods=["GET", "POST"])
 def books():
@@ -96,7 +291,8 @@ def books():
         title = request.form.get("title", "").strip()
         author = request.form.get("author", "Unknown").strip() or "Unknown"
         try:
-            resp = requests.post(f"{BOOKS_API}/api/books", json={"title": title, "author": author}, timeout=3)
+            resp = session.post(f"{BOOKS_API}/api/books", json={"title": title, "author": author}, timeout=3)
+            cache.invalidate(*CATALOG)
             if resp.status_code == 201:
                 return redirect(url_for("books"))
             else:
@@ -104,45 +300,21 @@ def books():
                 return redirect(url_for("books", error=err))
         except Exception:
             return redirect(url_for("books", error="Error contacting Books Service"))
-    try:
-        resp = requests.get(f"{BOOKS_API}/api/books", timeout=3)
-        books_list = resp.json() if resp.status_code == 200 else []
-    except Exception:
-        books_list = []
-        error = error or "Error contacting Books Service"
-    table = '<table border="1" cellpadding="6"><tr><th>ID</th><th>Title</th><th>Author</th><th>Status</th></tr>'
-    for b in books_list:
-        table += f'<tr><td>{b["id"]}</td><td>{b["title"]}</td><td>{b["author"]}</td><td>{b["status"]}</td></tr>'
-    table += '</table>'
-    # Available Books table (if endpoint exists)
-    try:
-        resp_avail = requests.get(f"{BOOKS_API}/api/books/available", timeout=3)
-        avail_books = resp_avail.json() if resp_avail.status_code == 200 else []
-        if avail_books:
-            avail_table = '<h2>Available Books</h2><table border="1" cellpadding="6"><tr><th>ID</th><th>Title</th><th>Author</th></tr>'
-            for b in avail_books:
-                avail_table += f'<tr><td>{b["id"]}</td><td>{b["title"]}</td><td>{b["author"]}</td></tr>'
-            avail_table += '</table>'
-        else:
-            avail_table = ''
-    except Exception:
-        avail_table = ''
-    form = '''<fieldset><legend>Add Book</legend>
-    <form method="post" action="/books">
-      Title: <input name="title" required> Author: <input name="author">
-      <button type="submit">Add</button>
-    </form></fieldset>'''
-    html = f'''<h1>Books</h1>{NAV}
-    {table}
-    {'<p><strong>Error:</strong> ' + error + '</p>' if error else ''}
-    {form}
-    {avail_table if avail_table else ''}
-    {FOOTER}'''
-    return render_template_string(html)
+    q = request.args.get("q", "").strip()
+    limit, params = page_args()
+    if q:
+        params["q"] = q
+    rows, results, fetch_error = fetch_page(
+        f"{BOOKS_API}/api/books", params, limit, "Error contacting Books Service",
+        extra={"available": (f"{BOOKS_API}/api/titles/available", {"limit": PAGE_SIZE})},
+    )
+    return stream_template("books.html", rows=rows, limit=limit, q=q, available=results["available"],
+                           error=error or fetch_error)
 
 @app.route("/borrow", methods=["GET", "POST"])
 def borrow():
     error = request.args.get("error")
+    message = request.args.get("message")
     if request.method == "POST":
         user_id = request.form.get("user_id", "").strip()
         book_id = request.form.get("book_id", "").strip()
@@ -150,8 +322,15 @@ def borrow():
         payload = {"user_id": user_id, "book_id": book_id}
         if days.isdigit():
             payload["days"] = int(days)
+        # A hold borrows the book if it is on the shelf and queues for it otherwise.
+        path = "/api/holds" if request.form.get("hold") else "/api/borrow"
         try:
-            resp = requests.post(f"{BOOKS_API}/api/borrow", json=payload, timeout=3)
+            resp = session.post(f"{BOOKS_API}{path}", json=payload, timeout=3)
+            cache.invalidate(*CATALOG, f"{BOOKS_API}/api/loans")
+            if resp.status_code == 201 and "hold_id" in resp.json():
+                hold = resp.json()
+                return redirect(url_for("borrow", message=f"Book {book_id} is out; hold {hold['hold_id']} "
+                                                          f"is number {hold['queue_position']} in the queue."))
             if resp.status_code == 201:
                 return redirect(url_for("loans", user_id=user_id))
             else:
@@ -159,16 +338,7 @@ def borrow():
                 return redirect(url_for("borrow", error=err))
         except Exception:
             return redirect(url_for("borrow", error="Error contacting Books Service"))
-    form = '''<fieldset><legend>Borrow Book</legend>
-    <form method="post" action="/borrow">
-      User ID: <input name="user_id" required> Book ID: <input name="book_id" required> Days: <input name="days" type="number" min="1">
-      <button type="submit">Borrow</button>
-    </form></fieldset>'''
-    html = f'''<h1>Borrow</h1>{NAV}
-    {'<p><strong>Error:</strong> ' + error + '</p>' if error else ''}
-    {form}
-    {FOOTER}'''
-    return render_template_string(html)
+    return render_template("borrow.html", error=error, message=message)
 
 @app.route("/return", methods=["GET", "POST"])
 def return_book():
@@ -176,7 +346,8 @@ def return_book():
     if request.method == "POST":
         book_id = request.form.get("book_id", "").strip()
         try:
-            resp = requests.post(f"{BOOKS_API}/api/return", json={"book_id": book_id}, timeout=3)
+            resp = session.post(f"{BOOKS_API}/api/return", json={"book_id": book_id}, timeout=3)
+            cache.invalidate(*CATALOG, f"{BOOKS_API}/api/loans", f"{BOOKS_API}/api/overdue")
             if resp.status_code == 200:
                 return redirect(url_for("loans"))
             else:
@@ -184,56 +355,35 @@ def return_book():
                 return redirect(url_for("return_book", error=err))
         except Exception:
             return redirect(url_for("return_book", error="Error contacting Books Service"))
-    form = '''<fieldset><legend>Return Book</legend>
-    <form method="post" action="/return">
-      Book ID: <input name="book_id" required>
-      <button type="submit">Return</button>
-    </form></fieldset>'''
-    html = f'''<h1>Return</h1>{NAV}
-    {'<p><strong>Error:</strong> ' + error + '</p>' if error else ''}
-    {form}
-    {FOOTER}'''
-    return render_template_string(html)
+    return render_template("return.html", error=error)
 
 @app.route("/loans")
 def loans():
     user_id = request.args.get("user_id")
     open_filter = request.args.get("open")
     error = request.args.get("error")
-    overdue_table = ''
-    # Overdue loans table (if endpoint exists)
-    try:
-        resp_overdue = requests.get(f"{BOOKS_API}/api/overdue", timeout=3)
-        overdue_loans = resp_overdue.json() if resp_overdue.status_code == 200 else []
-        if overdue_loans:
-            overdue_table = '<h2>Overdue Loans</h2><table border="1" cellpadding="6"><tr><th>Loan ID</th><th>User ID</th><th>Book ID</th><th>Borrowed</th><th>Due Date</th></tr>'
-            for l in overdue_loans:
-                overdue_table += f'<tr><td>{l["id"]}</td><td>{l["user_id"]}</td><td>{l["book_id"]}</td><td>{l["borrowed_at"]}</td><td>{l["due_date"]}</td></tr>'
-            overdue_table += '</table>'
-    except Exception:
-        overdue_table = ''
-    # Normal loans table
-    params = {}
+    limit, params = page_args()
+    # The loans and the name lookup run one after the other, within one deadline for the page.
+    deadline = time.monotonic() + PAGE_DEADLINE
+    # Most overdue first, read from the Books Service's due-date index.
+    overdue_params = {"limit": 100}
     if user_id:
         params["user_id"] = user_id
+        overdue_params["user_id"] = user_id
     if open_filter in ("true", "false"):
         params["open"] = open_filter
-    try:
-        resp = requests.get(f"{BOOKS_API}/api/loans", params=params, timeout=3)
-        loans_list = resp.json() if resp.status_code == 200 else []
-    except Exception:
-        loans_list = []
-        error = error or "Error contacting Books Service"
-    table = '<table border="1" cellpadding="6"><tr><th>Loan ID</th><th>User ID</th><th>Book ID</th><th>Borrowed</th><th>Returned</th></tr>'
-    for l in loans_list:
-        table += f'<tr><td>{l["id"]}</td><td>{l["user_id"]}</td><td>{l["book_id"]}</td><td>{l["borrowed_at"]}</td><td>{l["returned_at"]}</td></tr>'
-    table += '</table>'
-    html = f'''<h1>Loans</h1>{NAV}
-    {overdue_table if overdue_table else ''}
-    {table}
-    {'<p><strong>Error:</strong> ' + error + '</p>' if error else ''}
-    {FOOTER}'''
-    return render_template_string(html)
+    rows, results, fetch_error = fetch_page(
+        f"{BOOKS_API}/api/loans", params, limit, "Error contacting Books Service",
+        extra={"overdue": (f"{BOOKS_API}/api/overdue", overdue_params)}, timeout=time_left(deadline),
+    )
+    overdue = results["overdue"] or []
+    # Names and titles: one batch lookup per service for the page, not one per row.
+    if isinstance(rows, list):
+        user_names, book_titles = lookup_names(overdue + rows, time_left(deadline))
+        overdue, rows = named(overdue, user_names, book_titles), named(rows, user_names, book_titles)
+    else:
+        overdue, rows = named(overdue, *lookup_names(overdue, time_left(deadline))), _Named(rows)
+    return stream_template("loans.html", rows=rows, overdue=overdue, limit=limit, error=error or fetch_error)
 
 @app.route("/admin", methods=["GET", "POST"])
 def admin():
@@ -254,7 +404,8 @@ def admin():
                     payload["author"] = author
                 if not payload:
                     return redirect(url_for("admin", error="No fields to update"))
-                resp = requests.patch(f"{BOOKS_API}/api/books/{book_id}", json=payload, timeout=3)
+                resp = session.patch(f"{BOOKS_API}/api/books/{book_id}", json=payload, timeout=3)
+                cache.invalidate(*CATALOG)
                 if resp.status_code == 200:
                     return redirect(url_for("admin", message="Book updated"))
                 else:
@@ -262,7 +413,8 @@ def admin():
                     return redirect(url_for("admin", error=err))
             elif action == "delete_book":
                 book_id = request.form.get("book_id_del", "").strip()
-                resp = requests.delete(f"{BOOKS_API}/api/books/{book_id}", timeout=3)
+                resp = session.delete(f"{BOOKS_API}/api/books/{book_id}", timeout=3)
+                cache.invalidate(*CATALOG)
                 if resp.status_code == 200:
                     return redirect(url_for("admin", message="Book deleted"))
                 else:
@@ -270,7 +422,8 @@ def admin():
                     return redirect(url_for("admin", error=err))
             elif action == "delete_user":
                 user_id = request.form.get("user_id_del", "").strip()
-                resp = requests.delete(f"{USERS_API}/api/users/{user_id}", timeout=3)
+                resp = session.delete(f"{USERS_API}/api/users/{user_id}", timeout=3)
+                cache.invalidate(f"{USERS_API}/api/users")
                 if resp.status_code == 200:
                     return redirect(url_for("admin", message="User deleted"))
                 else:
@@ -278,32 +431,12 @@ def admin():
                     return redirect(url_for("admin", error=err))
         except Exception:
             return redirect(url_for("admin", error="Error contacting service"))
-    update_form = '''<fieldset><legend>Update Book</legend>
-    <form method="post" action="/admin">
-      <input type="hidden" name="action" value="update_book">
-      Book ID: <input name="book_id" required> New Title: <input name="title"> New Author: <input name="author">
-      <button type="submit">Update</button>
-    </form></fieldset>'''
-    del_book_form = '''<fieldset><legend>Delete Book</legend>
-    <form method="post" action="/admin">
-      <input type="hidden" name="action" value="delete_book">
-      Book ID: <input name="book_id_del" required>
-      <button type="submit">Delete Book</button>
-    </form></fieldset>'''
-    del_user_form = '''<fieldset><legend>Delete User</legend>
-    <form method="post" action="/admin">
-      <input type="hidden" name="action" value="delete_user">
-      User ID: <input name="user_id_del" required>
-      <button type="submit">Delete User</button>
-    </form></fieldset>'''
-    html = f'''<h1>Admin</h1>{NAV}
-    {'<p><strong>Message:</strong> ' + message + '</p>' if message else ''}
-    {'<p><strong>Error:</strong> ' + error + '</p>' if error else ''}
-    {update_form}
-    {del_book_form}
-    {del_user_form}
-    {FOOTER}'''
-    return render_template_string(html)
+    return render_template("admin.html", message=message, error=error)
+
+@app.route("/cache")
+def cache_stats():
+    """Backend response cache counters."""
+    return jsonify(cache.stats()), 200
 
 if __name__ == "__main__":
-    app.run(port=5000)
+    app.run(port=int(os.environ.get("PORTAL_PORT", 5000)))
@@ -0,0 +1,178 @@
+"""
+Token-bucket rate limiting for Flask routes.
+
+Each client key owns a bucket of ``count`` tokens that refills at ``count/period``
+tokens per second; a request takes one token or is answered with 429. Checks are
+O(1). Buckets live in a pluggable backend:
+
+- ``MemoryBackend``: per process, thread-safe, idle buckets evicted in LRU order.
+- ``SQLiteBackend``: a small SQLite file shared by every worker process on the host.
+
+Limits are declared per route with ``@limiter.limit("5/minute")`` and can be
+overridden without code changes through ``RATE_LIMITS`` (``"borrow=20/minute"``);
+``RATE_LIMIT_BACKEND`` selects ``memory`` (default) or ``sqlite:<path>``.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, request
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+IDLE_TIMEOUT = 600.0
+
+
+def parse_rate(rate: str):
+    """Parse ``"5/minute"`` or ``"5/60"`` into ``(count, period_seconds)``."""
+    count, _, period = rate.partition("/")
+    period = period.strip().lower()
+    seconds = PERIODS.get(period.rstrip("s")) or float(period)
+    return int(count), float(seconds)
+
+
+def _refill(tokens: float, updated: float, capacity: int, rate: float, now: float):
+    """Refill a bucket, take a token if there is one, and return ``(tokens, wait_seconds)``."""
+    tokens = min(float(capacity), tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBackend:
+    """Buckets in an in-process LRU dict; the least recently used idle buckets are evicted."""
+
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, capacity: int, rate: float) -> float:
+        """Take a token; return 0 if granted, else the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens, wait = _refill(tokens, updated, capacity, rate, now)
+            self._buckets[key] = (tokens, now)
+            while self._buckets:
+                oldest, (_, last_seen) = next(iter(self._buckets.items()))
+                if now - last_seen <= self.idle_timeout:
+                    break
+                del self._buckets[oldest]
+            return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteBackend:
+    """Buckets in a SQLite file, so every worker process shares the same limits."""
+
+    EVICT_EVERY = 1000
+
+    def __init__(self, path: str, idle_timeout: float = IDLE_TIMEOUT):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self._local = threading.local()
+        self._calls = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_bucket ("
+            " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_bucket_updated ON rate_bucket (updated)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def after_fork(self) -> None:
+        """Drop connections inherited from the parent; each process opens its own."""
+        self._local = threading.local()
+
+    def acquire(self, key: str, capacity: int, rate: float) -> float:
+        """Take a token; return 0 if granted, else the seconds until one is available."""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_bucket WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, wait = _refill(tokens, updated, capacity, rate, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_bucket (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now)
+            )
+            self._calls += 1
+            if self._calls % self.EVICT_EVERY == 0:
+                conn.execute("DELETE FROM rate_bucket WHERE updated < ?", (now - self.idle_timeout,))
+            conn.execute("COMMIT")
+        except BaseException:
+            # Some errors (a full disk, an I/O error) end the transaction themselves.
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+def backend_from_env():
+    spec = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+    if spec.startswith("sqlite:"):
+        return SQLiteBackend(spec[len("sqlite:"):])
+    if spec != "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND {spec!r}")
+    return MemoryBackend()
+
+
+def overrides_from_env() -> dict:
+    """Parse ``RATE_LIMITS="borrow=20/minute,return=100/minute"`` into ``{scope: (count, period)}``."""
+    overrides = {}
+    for item in filter(None, (part.strip() for part in os.environ.get("RATE_LIMITS", "").split(","))):
+        scope, _, rate = item.partition("=")
+        overrides[scope.strip()] = parse_rate(rate)
+    return overrides
+
+
+class RateLimiter:
+    """Per-route token-bucket limits keyed by client address."""
+
+    def __init__(self, backend=None, overrides: dict = None):
+        self.backend = backend or backend_from_env()
+        self.overrides = overrides if overrides is not None else overrides_from_env()
+
+    def after_fork(self) -> None:
+        """Call in each worker process forked from one that created the limiter."""
+        self.backend.after_fork()
+
+    def limit(self, rate: str, scope: str = None, key_func=None):
+        """Decorate a view so each client may call it ``rate`` times; routes sharing a ``scope`` share a budget."""
+        default = parse_rate(rate)
+
+        def decorator(view):
+            name = scope or view.__name__
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                count, period = self.overrides.get(name, default)
+                client = key_func() if key_func else request.remote_addr
+                wait = self.backend.acquire(f"{name}:{client}", count, count / period)
+                if wait:
+                    resp = jsonify({"error": "rate limit exceeded"})
+                    resp.headers["Retry-After"] = str(math.ceil(wait))
+                    return resp, 429
+                return view(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
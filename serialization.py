@@ -0,0 +1,80 @@
+"""
+Fast JSON serialization for the Books and Users list endpoints.
+
+List endpoints select plain column tuples instead of ORM objects (no identity
+map, no per-row instance state) and turn each tuple into a dict with a
+serializer compiled once per column set. Responses are encoded with orjson
+when it is installed and with the standard library otherwise. Both paths write
+datetimes the same way: ISO-8601 UTC to the second, e.g. ``2026-01-31T12:00:00Z``.
+"""
+
+from datetime import date, datetime
+from functools import lru_cache
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import DateTime
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+def isoformat(value):
+    """Format a naive UTC datetime as ISO-8601 with a ``Z`` suffix; None stays None."""
+    if value is None:
+        return None
+    return value.isoformat(timespec="seconds") + "Z"
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return isoformat(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return DefaultJSONProvider.default(value)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider with ISO-8601 datetimes, encoding through orjson when available."""
+
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+@lru_cache(maxsize=128)
+def row_serializer(columns: tuple, fields: tuple = None):
+    """Compile a function that turns a row selected as ``columns`` into a dict.
+
+    Only ``fields`` (column keys) are emitted when given; DateTime columns are
+    ISO-formatted.
+    """
+    items = []
+    for i, column in enumerate(columns):
+        if fields is not None and column.key not in fields:
+            continue
+        value = f"_iso(row[{i}])" if isinstance(column.type, DateTime) else f"row[{i}]"
+        items.append(f"{column.key!r}: {value}")
+    namespace = {"_iso": isoformat}
+    exec("def serialize(row):\n    return {" + ", ".join(items) + "}\n", namespace)
+    return namespace["serialize"]
+
+
+def as_rows(query, columns, fields=None):
+    """Return ``query`` narrowed to ``columns`` as plain tuples, and the serializer for its rows."""
+    columns = tuple(columns)
+    return query.with_entities(*columns), row_serializer(columns, tuple(fields) if fields else None)
@@ -0,0 +1,162 @@
+"""
+Production entry point for the Users, Books and Portal services.
+
+    python serve.py books --workers 4 --threads 8
+    python serve.py users --port 5001
+    python serve.py portal --bind 0.0.0.0
+
+Runs the service under gunicorn (several worker processes, each with a pool of
+request threads) when it is installed, or under waitress (one process, many
+threads; also works on Windows) otherwise. The app is imported and its schema
+migrated once in the parent before workers start, so no request ever runs
+``create_all``. Each worker then drops the database connections, HTTP
+keep-alive sockets and rate-limit connections it inherited from the parent.
+
+With more than one worker the Books Service keeps its borrow rate limits in a
+SQLite file shared by all workers (unless ``RATE_LIMIT_BACKEND`` is set), so a
+client gets the same budget whichever worker answers. SIGTERM stops accepting
+connections and lets in-flight requests finish for ``--graceful-timeout``
+seconds.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import tempfile
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # not available on Windows
+    BaseApplication = None
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+SERVICES = {
+    "users": ("users_service", "USERS_PORT", 5001),
+    "books": ("books_service", "BOOKS_PORT", 5050),
+    "portal": ("portal_service", "PORTAL_PORT", 5000),
+}
+
+
+def _http_sessions(module) -> list:
+    sessions = [getattr(module, "session", None)]
+    users_client = getattr(module, "users_client", None)
+    if users_client is not None:
+        sessions.append(users_client.session)
+    return [session for session in sessions if session is not None and hasattr(session, "mount")]
+
+
+def prepare(module) -> None:
+    """One-time setup in the parent process: bring the service's database schema up to date."""
+    if hasattr(module, "migrate_schema"):
+        with module.app.app_context():
+            module.migrate_schema()
+    if hasattr(module, "db"):
+        # Workers must not inherit connections the migration opened.
+        with module.app.app_context():
+            module.db.engine.dispose()
+
+
+def after_fork(module) -> None:
+    """Give a freshly forked worker its own connections."""
+    if hasattr(module, "db"):
+        with module.app.app_context():
+            module.db.engine.dispose(close=False)
+    for session in _http_sessions(module):
+        session.close()
+    if hasattr(module, "limiter"):
+        module.limiter.after_fork()
+    start_background(module)
+
+
+def start_background(module) -> None:
+    """Start the service's background work (the Books Service's loan archiver) in this process."""
+    if hasattr(module, "archiver"):
+        module.archiver.start()
+
+
+def shutdown(module) -> None:
+    """Release a worker's connections and background threads once it has stopped serving."""
+    if hasattr(module, "archiver"):
+        module.archiver.stop()
+    backend_pool = getattr(module, "backend_pool", None)
+    if backend_pool is not None:
+        backend_pool.shutdown(wait=False, cancel_futures=True)
+    for session in _http_sessions(module):
+        session.close()
+    if hasattr(module, "db"):
+        with module.app.app_context():
+            module.db.engine.dispose()
+
+
+if BaseApplication is not None:
+    class GunicornApplication(BaseApplication):
+        """Gunicorn configured in code, serving an already imported service module."""
+
+        def __init__(self, module, options: dict):
+            self.module = module
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+            self.cfg.set("post_fork", lambda server, worker: after_fork(self.module))
+            self.cfg.set("worker_exit", lambda server, worker: shutdown(self.module))
+
+        def load(self):
+            return self.module.app
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("service", choices=SERVICES)
+    parser.add_argument("--bind", default=os.environ.get("LIBRARY_BIND", "127.0.0.1"), help="address to listen on")
+    parser.add_argument("--port", type=int, help="defaults to the service's usual port or its *_PORT variable")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("LIBRARY_WORKERS", os.cpu_count() or 1)),
+                        help="worker processes (gunicorn only)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("LIBRARY_THREADS", 8)),
+                        help="request threads per worker")
+    parser.add_argument("--timeout", type=int, default=30, help="seconds before a stuck worker is restarted")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds in-flight requests get on shutdown")
+    args = parser.parse_args(argv)
+
+    module_name, port_env, default_port = SERVICES[args.service]
+    port = args.port or int(os.environ.get(port_env, default_port))
+    workers = args.workers if BaseApplication is not None else 1
+    if args.service == "books" and workers > 1 and "RATE_LIMIT_BACKEND" not in os.environ:
+        path = os.path.join(tempfile.gettempdir(), f"library-books-ratelimit-{port}.db")
+        os.environ["RATE_LIMIT_BACKEND"] = f"sqlite:{path}"
+
+    module = importlib.import_module(module_name)
+    prepare(module)
+
+    if BaseApplication is not None:
+        GunicornApplication(module, {
+            "bind": f"{args.bind}:{port}",
+            "workers": workers,
+            "threads": args.threads,
+            "worker_class": "gthread",
+            "timeout": args.timeout,
+            "graceful_timeout": args.graceful_timeout,
+            "preload_app": True,
+            "accesslog": "-",
+        }).run()
+    elif waitress is not None:
+        if args.workers > 1:
+            print("gunicorn is not installed; serving with waitress in one process.", file=sys.stderr)
+        start_background(module)
+        try:
+            waitress.serve(module.app, host=args.bind, port=port, threads=args.threads)
+        finally:
+            shutdown(module)
+    else:
+        raise SystemExit("Install gunicorn (Linux/macOS) or waitress (any platform) to use serve.py.")
+
+
+if __name__ == "__main__":
+    main()
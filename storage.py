@@ -0,0 +1,96 @@
+"""
+SQLite storage profiles and connection management shared by the Books and Users services.
+
+A profile is a set of pragmas applied to every new connection. It is chosen
+with ``LIBRARY_DB_PROFILE`` (or ``app.config["SQLITE_PROFILE"]``):
+
+- ``rollback``: SQLite defaults (rollback journal, synchronous=FULL); use on
+  network filesystems where WAL is not supported.
+- ``safe``: WAL with synchronous=FULL, every commit is durable.
+- ``balanced`` (default): WAL with synchronous=NORMAL, which cannot corrupt the
+  database but may lose the last commits on power loss; larger page cache,
+  memory-mapped reads and in-memory temp tables.
+- ``fast``: as balanced with synchronous=OFF and bigger cache/mmap, for
+  benchmarks and throwaway data.
+
+Every profile sets a busy timeout so a writer waits for the lock instead of
+failing immediately, and ``retry_on_busy`` re-runs a short write transaction
+that still hits ``database is locked``. Pool size and overflow come from
+``LIBRARY_DB_POOL_SIZE`` / ``LIBRARY_DB_MAX_OVERFLOW`` so multi-threaded
+servers do not queue on connections.
+"""
+
+import os
+import time
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+BUSY_TIMEOUT_MS = 5000
+
+PROFILES = {
+    "rollback": {"journal_mode": "DELETE", "synchronous": "FULL"},
+    "safe": {"journal_mode": "WAL", "synchronous": "FULL", "cache_size": -16000, "temp_store": "MEMORY"},
+    "balanced": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -16000,
+                 "mmap_size": 64 * 1024 * 1024, "temp_store": "MEMORY"},
+    "fast": {"journal_mode": "WAL", "synchronous": "OFF", "cache_size": -64000,
+             "mmap_size": 256 * 1024 * 1024, "temp_store": "MEMORY"},
+}
+DEFAULT_PROFILE = "balanced"
+
+
+def configure_storage(app, database_uri: str, uri_env: str) -> None:
+    """Set the database URI (overridable through ``uri_env``), profile and pool options on ``app`` before ``SQLAlchemy(app)``."""
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(uri_env, database_uri)
+    profile = app.config.setdefault("SQLITE_PROFILE", os.environ.get("LIBRARY_DB_PROFILE", DEFAULT_PROFILE))
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown SQLite profile {profile!r}; expected one of {', '.join(PROFILES)}")
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {
+        "pool_size": int(os.environ.get("LIBRARY_DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("LIBRARY_DB_MAX_OVERFLOW", 20)),
+        "pool_timeout": 10,
+        "connect_args": {
+            "timeout": BUSY_TIMEOUT_MS / 1000,
+            # Connections are handed between request threads by the pool.
+            "check_same_thread": False,
+            # Prepared statements kept per connection.
+            "cached_statements": 256,
+        },
+    })
+
+
+def configure_sqlite(app, db) -> None:
+    """Apply the app's profile pragmas to every connection ``db`` opens."""
+    pragmas = dict(PROFILES[app.config.get("SQLITE_PROFILE", DEFAULT_PROFILE)], busy_timeout=BUSY_TIMEOUT_MS)
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    with app.app_context():
+        event.listen(db.engine, "connect", on_connect)
+
+
+def is_busy_error(exc: OperationalError) -> bool:
+    message = str(exc.orig).lower()
+    return "locked" in message or "busy" in message
+
+
+def retry_on_busy(db, attempts: int = 5, base_delay: float = 0.02):
+    """Decorate a function that runs one transaction on ``db.session`` so it is retried when SQLite is busy."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as exc:
+                    db.session.rollback()
+                    if not is_busy_error(exc) or attempt == attempts - 1:
+                        raise
+                    time.sleep(base_delay * 2 ** attempt)
+        return wrapper
+    return decorator
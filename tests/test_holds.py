@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["BOOKS_DATABASE_URI"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "books.db")
+
+import pytest
+
+import books_service
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(books_service.users_client, "user_exists", lambda user_id: True)
+    with books_service.app.app_context():
+        books_service.migrate_schema()
+    return books_service.app.test_client()
+
+
+def test_place_hold_answers_like_borrow(client):
+    book = client.post("/api/books", json={"title": "Dune", "author": "Herbert"}).get_json()
+
+    borrowed = client.post("/api/holds", json={"user_id": 1, "book_id": book["id"]})
+    assert borrowed.status_code == 201
+    assert borrowed.get_json() == {"message": "Borrowed", "loan_id": borrowed.get_json()["loan_id"],
+                                   "title_id": book["title_id"]}
+
+    held = client.post("/api/holds", json={"user_id": 2, "book_id": book["id"]})
+    assert held.status_code == 201
+    body = held.get_json()
+    assert "book_id" not in body
+    assert body["message"] == "On hold"
+    assert body["title_id"] == book["title_id"]
+    assert body["queue_position"] == 1
+    assert client.get(f"/api/holds/{body['hold_id']}").get_json()["queue_position"] == 1
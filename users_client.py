@@ -0,0 +1,151 @@
+"""
+Client the Books Service uses to check that a borrower exists in the Users Service.
+
+Requests go over a pooled keep-alive session with strict timeouts. Answers are
+kept in a bounded TTL+LRU cache (known users for minutes, unknown ids for
+seconds) so repeat borrowers skip the network hop, and a circuit breaker stops
+calling the Users Service for a while after repeated failures instead of tying
+up Books workers on a service that is down.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+USERS_API = os.environ.get("USERS_API_URL", "http://localhost:5001")
+
+
+class UsersServiceUnavailable(Exception):
+    """The Users Service timed out, failed, or the circuit breaker is open."""
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a per-entry TTL."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures; after ``reset_timeout``
+    seconds a single trial call is let through and its outcome closes or re-opens it."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial_in_flight and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class UsersClient:
+    """Cached, circuit-broken existence checks against ``GET /api/users/<id>``."""
+
+    def __init__(self, base_url: str = USERS_API, connect_timeout: float = 0.5, read_timeout: float = 2.0,
+                 pool_size: int = 20, cache_size: int = 10000, found_ttl: float = 300.0,
+                 missing_ttl: float = 30.0, breaker: CircuitBreaker = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.found_ttl = found_ttl
+        self.missing_ttl = missing_ttl
+        self.cache = TTLCache(cache_size)
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def user_exists(self, user_id) -> bool:
+        """Return whether the user exists, raising UsersServiceUnavailable if that cannot be determined."""
+        key = str(user_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if not self.breaker.allow():
+            raise UsersServiceUnavailable("Users service circuit is open.")
+        try:
+            resp = self.session.get(f"{self.base_url}/api/users/{key}", timeout=self.timeout)
+        except requests.RequestException as exc:
+            self.breaker.record_failure()
+            raise UsersServiceUnavailable(str(exc)) from exc
+        return self.record_answer(key, resp.status_code)
+
+    def record_answer(self, user_id, status_code: int) -> bool:
+        """Cache and return what a ``GET /api/users/<id>`` status says about the user.
+
+        Also used by callers that make the request themselves (such as the async front end).
+        """
+        if status_code == 200:
+            exists, ttl = True, self.found_ttl
+        elif status_code == 404:
+            exists, ttl = False, self.missing_ttl
+        else:
+            self.breaker.record_failure()
+            raise UsersServiceUnavailable(f"Users service returned {status_code}.")
+        self.breaker.record_success()
+        self.cache.set(str(user_id), exists, ttl)
+        return exists
+
+    def forget(self, user_id) -> None:
+        """Drop any cached answer for ``user_id``."""
+        self.cache.discard(str(user_id))
@@ -1,8 +1,18 @@
 
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
+import click
+import os
 import re
 
+from change_versions import ChangeVersions
+from bulk_import import is_csv, iter_records, run_import
+from instrumentation import Metrics
+from pagination import list_response, parse_ids
+from serialization import JSONProvider, as_rows
+from storage import configure_sqlite, configure_storage
+
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -15,10 +25,15 @@ from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
+app.json = JSONProvider(app)
+configure_storage(app, 'sqlite:///users.db', 'USERS_DATABASE_URI')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
+configure_sqlite(app, db)
+versions = ChangeVersions(db)
+metrics = Metrics()
+metrics.init_app(app, db)
 
 
 # Health endpoint
@@ -36,6 +51,8 @@ class User(db.Model):
     def to_dict(self) -> dict:
         return {"id": self.id, "name": self.name, "email": self.email}
 
+USER_COLUMNS = (User.id, User.name, User.email)
+
 
 
 @app.route("/")
@@ -86,23 +103,83 @@ def about():
         return html, 200
 
 
+# Strict email pattern: characters (no spaces/@), then @, then domain (no spaces/@), dot, then exactly 3 letters.
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[A-Za-z]{3}$')
+
+def validate_user(data: dict):
+    """Return ``(fields, error)`` for a new user; duplicate emails are checked by the caller."""
+    name = str(data.get("name") or "").strip()
+    email = str(data.get("email") or "").strip()
+    if not name or not email:
+        return None, "Name and email are required."
+    if not EMAIL_RE.match(email):
+        return None, "Invalid email format (expected name@domain.tld with 3-letter TLD)."
+    return {"name": name, "email": email}, None
+
+
 @app.route("/api/users", methods=["POST"])
 def create_user():
     """Create a new user with validation."""
-    data = request.get_json()
-    name = (data or {}).get("name", "").strip()
-    email = (data or {}).get("email", "").strip()
-    if not name or not email:
-        return jsonify({"error": "Name and email are required."}), 400
-    # Strict email pattern: characters (no spaces/@), then @, then domain (no spaces/@), dot, then exactly 3 letters.
-    if not re.match(r'^[^@\s]+@[^@\s]+\.[A-Za-z]{3}$', email):
-        return jsonify({"error": "Invalid email format (expected name@domain.tld with 3-letter TLD)."}), 400
-    if User.query.filter_by(email=email).first():
+    fields, error = validate_user(request.get_json() or {})
+    if error:
+        return jsonify({"error": error}), 400
+    if User.query.filter_by(email=fields["email"]).first():
         return jsonify({"error": "Email already exists."}), 409
-    user = User(name=name, email=email)
+    user = User(**fields)
     db.session.add(user)
     db.session.commit()
     return jsonify(user.to_dict()), 201
+
+
+def _insert_users(chunk: list) -> list:
+    """Insert a chunk of users, rejecting emails that already exist in the table or earlier in the chunk."""
+    emails = [row["email"] for _, row in chunk]
+    taken = {e for (e,) in db.session.query(User.email).filter(User.email.in_(emails))}
+    rejected, rows = [], []
+    for line, row in chunk:
+        if row["email"] in taken:
+            rejected.append((line, "Email already exists."))
+        else:
+            taken.add(row["email"])
+            rows.append((line, row))
+    if not rows:
+        return rejected
+    try:
+        db.session.execute(db.insert(User), [row for _, row in rows])
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent writer took one of the emails; fall back to row-by-row inserts.
+        db.session.rollback()
+        for line, row in rows:
+            try:
+                db.session.execute(db.insert(User), [row])
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                rejected.append((line, "Email already exists."))
+    return rejected
+
+
+def import_users(stream, csv_format: bool = False) -> dict:
+    """Bulk-load users from an NDJSON or CSV byte stream."""
+    return run_import(iter_records(stream, csv_format), validate_user, _insert_users)
+
+
+@app.route("/api/users/import", methods=["POST"])
+def import_users_route():
+    """Bulk-load users from an NDJSON (default) or text/csv request body."""
+    return jsonify(import_users(request.stream, is_csv(request.content_type))), 200
+
+
+@app.cli.command("import-users")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def import_users_command(path):
+    """Bulk-load users from an NDJSON or .csv file."""
+    with open(path, "rb") as f:
+        report = import_users(f, is_csv(filename=path))
+    click.echo(f"Inserted {report['inserted']}, failed {report['failed']}.")
+    for error in report["errors"]:
+        click.echo(f"  line {error['line']}: {error['error']}")
 @app.route("/docs")
 def docs():
         """Users API documentation page."""
@@ -114,9 +191,11 @@ def docs():
         <table border="1" cellpadding="6">
             <tr><th>Method</th><th>Path</th><th>Notes</th></tr>
             <tr><td>POST</td><td>/api/users</td><td>Create user (name, email)</td></tr>
-            <tr><td>GET</td><td>/api/users</td><td>List all users</td></tr>
+            <tr><td>POST</td><td>/api/users/import</td><td>Bulk-load users from an NDJSON or text/csv body (name, email); per-line errors reported</td></tr>
+            <tr><td>GET</td><td>/api/users</td><td>List all users (paging: after_id, limit; format=ndjson streams; batch lookup: ids=1,2,3, up to 1000)</td></tr>
             <tr><td>GET</td><td>/api/users/&lt;id&gt;</td><td>Get user by ID</td></tr>
             <tr><td>GET</td><td>/api/health</td><td>Health check</td></tr>
+            <tr><td>GET</td><td>/metrics</td><td>Request latency, status counts and SQL statements per request (Prometheus text format)</td></tr>
         </table>
         <hr>
         <h2>Examples</h2>
@@ -135,15 +214,24 @@ def docs():
             <tr><td>400</td><td>Missing/empty name or email</td><td>{"error": "Name and email are required."}</td></tr>
             <tr><td>409</td><td>Duplicate email</td><td>{"error": "Email already exists."}</td></tr>
             <tr><td>404</td><td>User not found</td><td>{"error": "User not found."}</td></tr>
+            <tr><td>304</td><td>GET /api/users with a current If-None-Match/If-Modified-Since</td><td>(empty)</td></tr>
         </table>
         '''
         return html, 200
 
 @app.route("/api/users", methods=["GET"])
+@versions.conditional("user")
 def get_users():
-    """Get all users."""
-    users = User.query.all()
-    return jsonify([u.to_dict() for u in users]), 200
+    """List users, paged with after_id/limit or streamed; ``ids`` looks up a batch of users in one query."""
+    query, serialize = as_rows(User.query, USER_COLUMNS)
+    if "ids" not in request.args:
+        return list_response(query, User.id, serialize)
+    try:
+        ids = parse_ids(request.args["ids"])
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    # One batch larger than the id list, so a single IN query answers it.
+    return list_response(query.filter(User.id.in_(ids)), User.id, serialize, batch_size=len(ids) + 1)
 
 @app.route("/api/users/<int:user_id>", methods=["GET"])
 def get_user(user_id: int):
@@ -163,7 +251,11 @@ def delete_user(user_id: int):
     db.session.commit()
     return jsonify({"message": "User deleted."}), 200
 
+def migrate_schema():
+    """Create missing tables in users.db."""
+    db.create_all()
+
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
-    app.run(port=5001)
+        migrate_schema()
+    app.run(port=int(os.environ.get("USERS_PORT", 5001)))